@@ -1,19 +1,55 @@
 import os
+from functools import partial
 from flask import Flask, request, abort, jsonify, render_template
 from flask_cors import CORS
-from models import setup_db, Movie, Actor, ActionError, Assigning_actors_movies, Gender
-from datetime import datetime
-from auth import AuthError, requires_auth
+from models import setup_db, db, Movie, Actor, ActionError, Assigning_actors_movies
+from models import find_missing_ids, on_committed_changes, table_versions, delete_entities
+from auth import AuthError, requires_auth, check_permissions, any_of, permission_requirement
+from auth import request_permissions
 from sqlalchemy.exc import IntegrityError
-from endpoints_errors import verify_actor_submitted_info, no_actor_error, no_movie_error
-from endpoints_errors import verify_movie_submitted_info, movie_release_date_error
+from endpoints_errors import no_actor_error, no_movie_error
+from endpoints_errors import bulk_actors_error, bulk_movies_error, missing_references_error
+from endpoints_errors import bulk_delete_error
+from pagination import page_args, keyset_page, ordered, stream_response
+from listings import listing_query, listing_conditions
+from search import search_args, search
+from endpoints_errors import max_search_window
+from metrics import registry, metrics_token, metrics_public
+from timings import start_request_timing, finish_request_timing
+from transactions import end_request_transaction, rollback_request_transaction
+import hmac
+from bulk import bulk_items, bulk_create_actors, bulk_create_movies
+from bulk import delete_ids, bulk_delete
+from validators import actor_schema, movie_schema
+from cache import LRUCache, ResponseCache, params_key, make_etag
+from serializers import actor_layout, movie_layout, json_response
+from entities import formatted_entity, formatted_entities, is_unchanged, include_args
+
+# serialized GET payloads, invalidated once the underlying rows are committed
+response_cache = ResponseCache(
+  LRUCache(maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', 256))),
+  ttl=int(os.environ.get('RESPONSE_CACHE_TTL', 0))
+)
+on_committed_changes(response_cache.invalidate)
+
+# permissions checked by the views themselves, on top of their requires_auth one
+get_actors_requirement = permission_requirement('get:actors')
+get_movies_requirement = permission_requirement('get:movies')
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  if test_config is None:
+    setup_db(app)
+  else:
+    app.config.from_mapping(test_config)
+    setup_db(app, test_config.get('SQLALCHEMY_DATABASE_URI'))
   CORS(app)
 
+  # per route latency metrics and Server-Timing header
+  app.before_request(start_request_timing)
+  app.after_request(finish_request_timing)
+
   # CORS Headers
   @app.after_request
   def after_request(response):
@@ -27,43 +63,194 @@ def create_app(test_config=None):
       )
     return response
 
+  # one transaction per request, committed before the other response hooks
+  # run (they run in the reverse order of their registration)
+  app.after_request(end_request_transaction)
+  app.teardown_request(rollback_request_transaction)
+
+  '''
+  conditional_get(table, build_response)
+    GET of a listing of `table`: its ETag derives from the table version
+    counter and the query parameters, a matching If-None-Match gets a 304
+    without any row being read, otherwise the cached body is served or
+    build_response() is called and its body cached
+  '''
+  def conditional_get(table, build_response):
+    params = params_key(request.args)
+    version = table_versions(table)[table]
+    etag = make_etag(table, version, params)
+    if request.if_none_match.contains(etag):
+      response = app.response_class(status=304)
+    else:
+      cache_key, body = response_cache.lookup(table, (version, params))
+      if body is not None:
+        response = app.response_class(body, mimetype='application/json')
+      else:
+        response = build_response()
+        response_cache.store(cache_key, response.get_data())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
   @app.route('/')
   def test():
     return render_template('index.html')
   
-  @app.route('/actors')
-  @requires_auth('get:actors')
-  def get_actors(payload):
-    actors = Actor.query.order_by('id').all()
-    if len(actors) == 0:
-      raise no_actor_error
-    formatted_actors = [actor.format() for actor in actors]
+  @app.route('/health')
+  def health():
+    # readiness probe: the worker serves requests and reaches the database
+    try:
+      db.session.execute('SELECT 1')
+    except Exception:
+      db.session.rollback()
+      return jsonify({
+        'success': False,
+        'database': 'unreachable'
+      }), 503
     return jsonify({
       'success': True,
-      'actors': formatted_actors,
-      'total_actors': len(formatted_actors)
+      'database': 'ok'
     })
+
+  @app.route('/metrics')
+  def metrics():
+    # Prometheus text format, behind a static bearer token when METRICS_TOKEN
+    # is set, only served without one when METRICS_PUBLIC is true
+    if metrics_token is None:
+      if not metrics_public:
+        abort(404)
+    else:
+      expected = 'Bearer %s' % metrics_token
+      if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+        raise AuthError({
+          'error': 'unauthorized',
+          'description': 'Metrics token missing or invalid.'
+        }, 401)
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+  @app.route('/actors')
+  @requires_auth('get:actors')
+  def get_actors(payload):
+    # rows are read as columns tuples, only the asked fields, and the movies
+    # ids of all of them with one more query when asked
+    query, fields, sort = listing_query('actors', request.args)
+    format_rows = partial(actor_layout.format, names=fields)
+    stream_format = request.args.get('stream')
+    if stream_format is not None:
+      return stream_response('actors', ordered(query, Actor.id, sort), format_rows, stream_format)
+    def actors_response():
+      limit, after = page_args(request.args)
+      if limit is None:
+        actors = ordered(query, Actor.id, sort).all()
+        next_cursor = None
+      else:
+        actors, next_cursor = keyset_page(query, Actor.id, limit, after, sort)
+      if len(actors) == 0 and after is None:
+        raise no_actor_error
+      formatted_actors = format_rows(actors)
+      if limit is not None:
+        return json_response({
+          'success': True,
+          'actors': formatted_actors,
+          'next_cursor': next_cursor
+        })
+      return json_response({
+        'success': True,
+        'actors': formatted_actors,
+        'total_actors': len(formatted_actors)
+      })
+    return conditional_get('actors', actors_response)
   
   @app.route('/movies')
   @requires_auth('get:movies')
   def get_movies(payload):
-    movies = Movie.query.order_by('id').all()
-    if len(movies) == 0:
-      raise no_movie_error
-    formatted_movies = [movie.format() for movie in movies]
-    return jsonify({
+    # rows are read as columns tuples, only the asked fields, and the actors
+    # ids of all of them with one more query when asked
+    query, fields, sort = listing_query('movies', request.args)
+    format_rows = partial(movie_layout.format, names=fields)
+    stream_format = request.args.get('stream')
+    if stream_format is not None:
+      return stream_response('movies', ordered(query, Movie.id, sort), format_rows, stream_format)
+    def movies_response():
+      limit, after = page_args(request.args)
+      if limit is None:
+        movies = ordered(query, Movie.id, sort).all()
+        next_cursor = None
+      else:
+        movies, next_cursor = keyset_page(query, Movie.id, limit, after, sort)
+      if len(movies) == 0 and after is None:
+        raise no_movie_error
+      formatted_movies = format_rows(movies)
+      if limit is not None:
+        return json_response({
+          'success': True,
+          'movies': formatted_movies,
+          'next_cursor': next_cursor
+        })
+      return json_response({
+        'success': True,
+        'movies': formatted_movies,
+        'total_movies': len(formatted_movies)
+      })
+    return conditional_get('movies', movies_response)
+  
+  @app.route('/actors/<int:actor_id>')
+  @requires_auth('get:actors')
+  def get_actor(payload, actor_id):
+    include = include_args(request.args, ('movies',))
+    versions = table_versions('actors', 'movies')
+    actor = formatted_entity(Actor, actor_id, versions)
+    if actor is None:
+      abort(404)
+    response = {
+      'success': True,
+      'actor': actor
+    }
+    if 'movies' in include:
+      check_permissions(get_movies_requirement, payload, request_permissions(payload))
+      movies = formatted_entities(Movie, actor['movies'], versions)
+      response['movies'] = [movies[id] for id in actor['movies'] if id in movies]
+    return json_response(response)
+
+  @app.route('/movies/<int:movie_id>')
+  @requires_auth('get:movies')
+  def get_movie(payload, movie_id):
+    include = include_args(request.args, ('actors',))
+    versions = table_versions('movies', 'actors')
+    movie = formatted_entity(Movie, movie_id, versions)
+    if movie is None:
+      abort(404)
+    response = {
       'success': True,
-      'movies': formatted_movies,
-      'total_movies': len(formatted_movies)
+      'movie': movie
+    }
+    if 'actors' in include:
+      check_permissions(get_actors_requirement, payload, request_permissions(payload))
+      actors = formatted_entities(Actor, movie['actors'], versions)
+      response['actors'] = [actors[id] for id in movie['actors'] if id in actors]
+    return json_response(response)
+
+  @app.route('/search')
+  @requires_auth(any_of('get:actors', 'get:movies'))
+  def search_names(payload):
+    # typeahead over actors names and movies titles, ranked by trigram similarity
+    query, tables, limit, offset = search_args(request.args, request_permissions(payload))
+    results = search(query, tables, limit, offset)
+    next_offset = offset + limit
+    if len(results) < limit or next_offset >= max_search_window:
+      next_offset = None
+    return json_response({
+      'success': True,
+      'results': results,
+      'next_offset': next_offset
     })
-  
+
   @app.route('/movies/<int:movie_id>', methods=['DELETE'])
   @requires_auth('delete:movies')
   def delete_movie(payload, movie_id):
-    movie = Movie.query.get(movie_id)
-    if movie is None:
+    # deleted without being loaded, the row count tells whether it existed
+    if not delete_entities(Movie, [movie_id]):
       abort(404)
-    movie.delete()
     return jsonify({
       'success': True,
       'deleted': movie_id
@@ -72,14 +259,46 @@ def create_app(test_config=None):
   @app.route('/actors/<int:actor_id>', methods=['DELETE'])
   @requires_auth('delete:actors')
   def delete_actor(payload, actor_id):
-    actor = Actor.query.get(actor_id)
-    if actor is None:
+    # deleted without being loaded, the row count tells whether it existed
+    if not delete_entities(Actor, [actor_id]):
       abort(404)
-    actor.delete()
     return jsonify({
       'success': True,
       'deleted': actor_id
     })
+
+  '''
+  bulk_delete_response(table, model)
+    DELETE of the `table` rows of the ids sent in the body and/or matching
+    the listing filters of the query string, in a single transaction
+  '''
+  def bulk_delete_response(table, model):
+    try:
+      body = request.get_json()
+    except:
+      abort(400)
+    ids = delete_ids(body)
+    conditions = listing_conditions(table, request.args)
+    if ids is None and not conditions:
+      # deleting every row takes an explicit filter
+      raise bulk_delete_error
+    deleted, missing = bulk_delete(model, ids, conditions)
+    return json_response({
+      'success': True,
+      'deleted': deleted,
+      'missing': missing,
+      'total_deleted': len(deleted)
+    })
+
+  @app.route('/movies', methods=['DELETE'])
+  @requires_auth('delete:movies')
+  def delete_movies(payload):
+    return bulk_delete_response('movies', Movie)
+
+  @app.route('/actors', methods=['DELETE'])
+  @requires_auth('delete:actors')
+  def delete_actors(payload):
+    return bulk_delete_response('actors', Actor)
   
   @app.route('/actors', methods=['POST'])
   @requires_auth('post:actors')
@@ -88,21 +307,16 @@ def create_app(test_config=None):
       body = request.get_json()
     except:
       abort(400)
-    name = body.get('name')
-    age = body.get('age')
-    gender = body.get('gender')
-    movies = body.get('movies', [])
-    movies = verify_actor_submitted_info(name, age, gender, movies)
-    if gender.lower() != 'male': gender = Gender.female
-    else: gender = Gender.male
-    new_actor = Actor(name, age, gender, movies)
-    attributes = vars(new_actor)
-    for couple in attributes.items():
-      if couple[1] is None:
-        raise ActionError({
-        'error': 'missing actor informations',
-        'description': '`%s` is required'%couple[0]
-        }, 422)
+    actor = actor_schema.validate(body)
+    name = actor['name']
+    movies = actor.get('movies', ())
+    missing_movies = find_missing_ids(Movie, movies)
+    if missing_movies:
+      raise missing_references_error('movie', 'actor', missing_movies)
+    # the assignments are only built once the actor is known to be valid
+    new_actor = Actor(name, actor['age'], actor['gender'], [
+      Assigning_actors_movies(movie_id=movie_id) for movie_id in movies
+    ])
     try:
       new_actor.insert()
       return jsonify({
@@ -110,6 +324,7 @@ def create_app(test_config=None):
         'created': new_actor.id
       })
     except IntegrityError as e:
+      description = 'Integrity constraint violated'
       if 'unique constraint' in str(e.orig):
         description = 'Duplicated actor name, actor `%s` alrady exists'%name
       elif 'foreign key constraint' in str(e.orig):
@@ -129,23 +344,16 @@ confim their ids before assign to actor'
       body = request.get_json()
     except:
       abort(400)
-    title = body.get('title')
-    release_date = body.get('release_date')
-    actors = body.get('actors', [])
-    actors = verify_movie_submitted_info(title, release_date, actors)
-    release_date += '00'
-    try:
-      dt_realease_date = datetime.strptime(release_date, '%d/%m/%Y %H:%M UTC%z')
-    except:
-      raise movie_release_date_error
-    new_movie = Movie(title, dt_realease_date, actors)
-    attributes = vars(new_movie)
-    for couple in attributes.items():
-      if couple[1] is None:
-        raise ActionError({
-        'error': 'missing movie informations',
-        'description': '`%s` is required'%couple[0]
-        }, 422)
+    movie = movie_schema.validate(body)
+    title = movie['title']
+    actors = movie.get('actors', ())
+    missing_actors = find_missing_ids(Actor, actors)
+    if missing_actors:
+      raise missing_references_error('actor', 'movie', missing_actors)
+    # the assignments are only built once the movie is known to be valid
+    new_movie = Movie(title, movie['release_date'], [
+      Assigning_actors_movies(actor_id=actor_id) for actor_id in actors
+    ])
     try:
       new_movie.insert()
       return jsonify({
@@ -153,6 +361,7 @@ confim their ids before assign to actor'
         'created': new_movie.id
       })
     except IntegrityError as e:
+      description = 'Integrity constraint violated'
       if 'unique constraint' in str(e.orig):
         description = 'Duplicated movie title, movie `%s` alrady exists'%title
       elif 'foreign key constraint' in str(e.orig):
@@ -165,41 +374,83 @@ confim their ids before assign to movie'
     except:
       abort(422)
   
+  @app.route('/actors/bulk', methods=['POST'])
+  @requires_auth('post:actors')
+  def create_actors(payload):
+    try:
+      body = request.get_json()
+    except:
+      abort(400)
+    created = bulk_create_actors(bulk_items(body, 'actors', bulk_actors_error))
+    return jsonify({
+      'success': True,
+      'created': created,
+      'total_created': len(created)
+    })
+
+  @app.route('/movies/bulk', methods=['POST'])
+  @requires_auth('post:movies')
+  def create_movies(payload):
+    try:
+      body = request.get_json()
+    except:
+      abort(400)
+    created = bulk_create_movies(bulk_items(body, 'movies', bulk_movies_error))
+    return jsonify({
+      'success': True,
+      'created': created,
+      'total_created': len(created)
+    })
+  
   @app.route('/actors/<int:actor_id>', methods=['PATCH'])
   @requires_auth('patch:actors')
   def update_actor(payload, actor_id):
-    actor = Actor.query.get(actor_id)
-    if actor is None:
+    cached_actor = formatted_entity(Actor, actor_id)
+    if cached_actor is None:
       abort(404)
     try:
       body = request.get_json()
     except:
       abort(400)
     updated = False
-    name = body.get('name')
-    age = body.get('age')
-    gender = body.get('gender')
-    movies = body.get('movies')
-    actors_movies = verify_actor_submitted_info(name, age, gender, movies)
+    changes = actor_schema.validate(body, partial=True)
+    name = changes.get('name')
+    age = changes.get('age')
+    gender = changes.get('gender')
+    movies = changes.get('movies')
+    if movies is not None:
+      missing_movies = find_missing_ids(Movie, movies)
+      if missing_movies:
+        raise missing_references_error('movie', 'actor', missing_movies)
+    # nothing to write, answered from the identity cache without loading the actor
+    if is_unchanged(cached_actor, {'name': name, 'age': age, 'gender': gender and gender.name, 'movies': movies}):
+      return jsonify({
+        'success': True,
+        'updated': 'unchanged'
+      })
+    actor = Actor.query.get(actor_id)
+    if actor is None:
+      abort(404)
     if name is not None and actor.name != name:
       actor.name = name
       updated = True
     if age is not None and actor.age != age:
       actor.age = age
       updated = True
-    if gender is not None and actor.gender.name != gender: 
+    if gender is not None and actor.gender != gender:
       actor.gender = gender
       updated = True
-    if movies is not None and [actor_movie.movie_id for actor_movie in actor.movies] != movies:
-      actor.movies = actors_movies
-      updated = True
     try:
+      # only the added and removed movies are written, order is ignored
+      if movies is not None and actor.set_movies(movies):
+        updated = True
       if updated: actor.update()
       return jsonify({
         'success': True,
         'updated': actor.format() if updated else 'unchanged'
       })
     except IntegrityError as e:
+      description = 'Integrity constraint violated'
       if 'unique constraint' in str(e.orig):
         description = 'Duplicated actor name, actor `%s` alrady exists'%name
       elif 'foreign key constraint' in str(e.orig):
@@ -215,37 +466,49 @@ confim their ids before assign to actor'
   @app.route('/movies/<int:movie_id>', methods=['PATCH'])
   @requires_auth('patch:movies')
   def update_movie(payload, movie_id):
-    movie = Movie.query.get(movie_id)
-    if movie is None:
+    cached_movie = formatted_entity(Movie, movie_id)
+    if cached_movie is None:
       abort(404)
     try:
       body = request.get_json()
     except:
       abort(400)
     updated = False
-    title = body.get('title')
-    release_date = body.get('release_date')
-    actors = body.get('actors')
-    actors_movies = verify_movie_submitted_info(title, release_date, actors)
-    if release_date is not None:
-      release_date += '00'
-      dt_realease_date = datetime.strptime(release_date, '%d/%m/%Y %H:%M UTC%z')
-      if dt_realease_date != movie.release_date:
-        movie.release_date = dt_realease_date
-        updated = True
+    changes = movie_schema.validate(body, partial=True)
+    title = changes.get('title')
+    release_date = changes.get('release_date')
+    actors = changes.get('actors')
+    if actors is not None:
+      missing_actors = find_missing_ids(Actor, actors)
+      if missing_actors:
+        raise missing_references_error('actor', 'movie', missing_actors)
+    # nothing to write, answered from the identity cache without loading the movie
+    # (release dates are compared on the loaded movie, the formatted one drops offset minutes)
+    if release_date is None and is_unchanged(cached_movie, {'title': title, 'actors': actors}):
+      return jsonify({
+        'success': True,
+        'updated': 'unchanged'
+      })
+    movie = Movie.query.get(movie_id)
+    if movie is None:
+      abort(404)
+    if release_date is not None and release_date != movie.release_date:
+      movie.release_date = release_date
+      updated = True
     if title is not None and title != movie.title: 
       movie.title = title
       updated = True
-    if actors is not None and [actor_movie.actor_id for actor_movie in movie.actors] != actors:
-      movie.actors = actors_movies
-      updated = True
     try:
+      # only the added and removed actors are written, order is ignored
+      if actors is not None and movie.set_actors(actors):
+        updated = True
       if updated: movie.update()
       return jsonify({
         'success': True,
         'updated': movie.format() if updated else 'unchanged'
       })
     except IntegrityError as e:
+      description = 'Integrity constraint violated'
       if 'unique constraint' in str(e.orig):
         description = 'Duplicated movie title, movie `%s` alrady exists'%title
       elif 'foreign key constraint' in str(e.orig):
@@ -320,7 +583,16 @@ confim their ids before assign to movie'
 
   return app
 
-app = create_app()
+'''
+app
+    the application served by `gunicorn app:app`, created on first access
+    rather than at import, so importing this module needs no database
+'''
+def __getattr__(name):
+  if name == 'app':
+    globals()['app'] = create_app()
+    return globals()['app']
+  raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,141 @@
+'''
+ASGI entry point of the API
+
+usage:
+    uvicorn asgi:app --workers 4
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 4
+
+the event loop holds the client connections (keep alive, slow clients)
+and the handlers of create_app run unchanged on a pool of WEB_THREADS
+threads (default 8, also the size of each worker database pool), so a
+worker serves many concurrent clients while requests wait on the
+database or on the JWKS endpoint
+'''
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('WEB_THREADS', '8')
+
+'''
+WsgiToAsgi(wsgi_app, threads)
+    serves a WSGI application to ASGI servers, each request runs on one
+    of `threads` threads, the response body is sent chunk by chunk as
+    the application yields it (streamed listings)
+'''
+class WsgiToAsgi:
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('unsupported ASGI scope type %s' % scope['type'])
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        environ = self.environ(scope, b''.join(body))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.run, environ, send, loop)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def environ(self, scope, body):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        # the ASGI path includes the root path, the WSGI one does not
+        script_name = scope.get('root_path', '')
+        path_info = scope['path']
+        if script_name and path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name.encode().decode('latin-1'),
+            'PATH_INFO': path_info.encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                environ[name] = value
+                continue
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+        environ.setdefault('CONTENT_LENGTH', str(len(body)))
+        return environ
+
+    def run(self, environ, send, loop):
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {'started': False}
+
+        def start():
+            response['started'] = True
+            call({
+                'type': 'http.response.start',
+                'status': response['status'],
+                'headers': response['headers']
+            })
+
+        def write(chunk):
+            # the legacy WSGI imperative body API, chunks are sent as they come
+            if not response['started']:
+                start()
+            if chunk:
+                call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response['started']:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+            return write
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    write(chunk)
+            if not response['started']:
+                start()
+            call({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+from app import app as wsgi_app
+from pool import web_threads
+
+app = WsgiToAsgi(wsgi_app, threads=web_threads)
@@ -1,8 +1,10 @@
-import json
-from flask import request, _request_ctx_stack
+from flask import request, _request_ctx_stack, g
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+from jwks import JwksCache, JwksError, UrlJwksSource, FileJwksSource
+from cache import LRUCache
+from timings import timed
+from collections import namedtuple
+import hashlib
 import os
 
 
@@ -10,6 +12,35 @@ AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN', 'nassimb.auth0.com')
 ALGORITHMS = ['RS256']
 API_AUDIENCE = os.environ.get('API_AUDIENCE', 'casting_agency')
 
+# seconds the Auth0 signing keys are trusted before being refetched
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 600))
+
+# minimum seconds between two refetches, caps fetches triggered by unknown kids
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+
+# optional local jwks document, used instead of Auth0 (offline runs)
+JWKS_FILE = os.environ.get('JWKS_FILE')
+
+if JWKS_FILE:
+    jwks_source = FileJwksSource(JWKS_FILE)
+else:
+    jwks_source = UrlJwksSource(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+jwks_cache = JwksCache(
+    jwks_source,
+    ttl=JWKS_CACHE_TTL,
+    min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL
+)
+
+# maximum number of verified tokens kept, 0 disables the cache
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+
+# sha256(token) -> VerifiedToken, entries expire at the token `exp` claim
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
+# decoded payload and its permissions frozenset, cached together
+VerifiedToken = namedtuple('VerifiedToken', ['payload', 'permissions'])
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -58,24 +89,88 @@ def get_token_auth_header():
     return token
 
 
+'''
+PermissionRequirement
+    the permissions an endpoint requires, built once at decoration time
+    require_all=True: every permission must be granted (see all_of)
+    require_all=False: at least one of them must be granted (see any_of)
+    is_satisfied_by(granted) expects the token permissions as a frozenset,
+    so checking a requirement neither scans a list nor allocates
+'''
+class PermissionRequirement:
+    def __init__(self, permissions, require_all=True):
+        self.permissions = frozenset(permissions)
+        self.require_all = require_all
+        if len(self.permissions) == 1:
+            self.permission, = self.permissions
+            self.is_satisfied_by = self._has_permission
+        elif require_all:
+            self.is_satisfied_by = self.permissions.issubset
+        else:
+            self.is_satisfied_by = self._has_any_permission
+
+    def _has_permission(self, granted):
+        return self.permission in granted
+
+    def _has_any_permission(self, granted):
+        return not self.permissions.isdisjoint(granted)
+
+def all_of(*permissions):
+    return PermissionRequirement(permissions, require_all=True)
+
+def any_of(*permissions):
+    return PermissionRequirement(permissions, require_all=False)
+
+def permission_requirement(permission):
+    if isinstance(permission, PermissionRequirement):
+        return permission
+    return PermissionRequirement((permission,))
+
+'''
+token_permissions(payload)
+    the payload `permissions` claim as a frozenset, None if it is missing or malformed
+'''
+def token_permissions(payload):
+    permissions = payload.get('permissions')
+    if not isinstance(permissions, (list, tuple)):
+        return None
+    try:
+        return frozenset(permissions)
+    except TypeError:
+        return None
+
+'''
+request_permissions(payload)
+    the permissions of the token verified for the current request, cached
+    with it, computed from `payload` when it is not that token payload
+'''
+def request_permissions(payload):
+    verified = g.get('verified_token')
+    if verified is not None and verified.payload is payload:
+        return verified.permissions
+    return token_permissions(payload)
+
 '''
 @TODO implement check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink') or PermissionRequirement
         payload: decoded jwt payload
+        granted: optional precomputed token_permissions(payload)
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
 '''
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
+def check_permissions(permission, payload, granted=None):
+    if granted is None:
+        granted = token_permissions(payload)
+    if granted is None:
         raise AuthError({
             'error': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400) # Client side error Bad request
-    if permission not in payload['permissions']:
+    if not permission_requirement(permission).is_satisfied_by(granted):
         raise AuthError({
             'error': 'unauthorized',
             'description': 'Permission not found.'
@@ -95,10 +190,35 @@ def check_permissions(permission, payload):
     return the decoded payload
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+
+    verified payloads are kept in token_cache until their `exp` claim, so a
+    reused token skips the signature verification
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    return verify_token(token).payload
+
+'''
+verify_token(token)
+    cached verification returning a VerifiedToken
+'''
+def verify_token(token):
+    token_key = hashlib.sha256(token.encode()).digest()
+    verified = token_cache.get(token_key)
+    if verified is None:
+        payload = decode_jwt(token)
+        verified = VerifiedToken(payload, token_permissions(payload))
+        if isinstance(payload.get('exp'), (int, float)):
+            token_cache.set(token_key, verified, expires_at=payload['exp'])
+    return verified
+
+'''
+decode_jwt(token)
+    uncached verification: signature against the JWKS key, then claims
+'''
+def decode_jwt(token):
+    # jose (and its crypto backends) is imported by the first token
+    # verification rather than by every process importing the app
+    from jose import jwt
     try:
         unverified_header = jwt.get_unverified_header(token)
     except:
@@ -106,22 +226,19 @@ def verify_decode_jwt(token):
                 'error': 'invalid_header',
                 'description': 'Unable to parse authentication token.'
             }, 400)  # Client side error Bad request
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'error': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401) # Client side error Unauthorized
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        rsa_key = jwks_cache.get_key(unverified_header['kid'])
+    except JwksError:
+        raise AuthError({
+            'error': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503) # Server side error Service unavailable
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -159,20 +276,25 @@ def verify_decode_jwt(token):
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'), or a combination
+            built with any_of(...) / all_of(...)
 
     it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
+    it should use the verify_token method to decode the jwt (cached with its permissions)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
 def requires_auth(permission=''):
+    requirement = permission_requirement(permission)
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
-            return f(payload, *args, **kwargs)
+            with timed('auth'):
+                token = get_token_auth_header()
+                verified = verify_token(token)
+                check_permissions(requirement, verified.payload, verified.permissions)
+            # the views checking more permissions reuse its cached ones
+            g.verified_token = verified
+            return f(verified.payload, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
\ No newline at end of file
@@ -0,0 +1,115 @@
+'''
+Lookup and delete latency on a large actors_movies like table,
+without then with the (actor_id, movie_id) / (movie_id, actor_id) indexes
+
+usage:
+    python benchmarks/association_indexes.py [--rows 1000000] [--repeat 200]
+
+runs against DATABASE_URL, in a scratch `bench_actors_movies` table
+dropped at the end, the application tables are not touched
+'''
+import argparse
+import os
+import random
+import statistics
+import time
+from sqlalchemy import create_engine, text
+
+table = 'bench_actors_movies'
+
+'''
+seed(engine, rows, actors, cast)
+    `rows` distinct assignments, movies of `cast` actors picked among `actors`
+'''
+def seed(engine, rows, actors, cast):
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS %s' % table))
+        conn.execute(text(
+            'CREATE TABLE %s (id INTEGER PRIMARY KEY, actor_id INTEGER NOT NULL, '
+            'movie_id INTEGER NOT NULL)' % table
+        ))
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text(
+                'INSERT INTO %s (id, actor_id, movie_id) '
+                'SELECT n, n %% :actors, n / :cast FROM generate_series(1, :rows) n' % table
+            ), actors=actors, cast=cast, rows=rows)
+        else:
+            batch = 10000
+            for start in range(1, rows + 1, batch):
+                conn.execute(text(
+                    'INSERT INTO %s (id, actor_id, movie_id) VALUES (:id, :actor_id, :movie_id)' % table
+                ), [
+                    {'id': n, 'actor_id': n % actors, 'movie_id': n // cast}
+                    for n in range(start, min(start + batch, rows + 1))
+                ])
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text('ANALYZE %s' % table))
+
+def create_indexes(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE UNIQUE INDEX ix_%s_actor_id_movie_id ON %s (actor_id, movie_id)' % (table, table)
+        ))
+        conn.execute(text(
+            'CREATE INDEX ix_%s_movie_id_actor_id ON %s (movie_id, actor_id)' % (table, table)
+        ))
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text('ANALYZE %s' % table))
+
+'''
+timed(engine, statement, values)
+    median and max milliseconds of `statement` run once per value,
+    each run is rolled back so deletes don't change the table
+'''
+def timed(engine, statement, values):
+    durations = []
+    with engine.connect() as conn:
+        for value in values:
+            transaction = conn.begin()
+            start = time.perf_counter()
+            result = conn.execute(text(statement), value=value)
+            if result.returns_rows:
+                result.fetchall()
+            durations.append((time.perf_counter() - start) * 1000)
+            transaction.rollback()
+    return statistics.median(durations), max(durations)
+
+def measure(engine, actors, movies, repeat):
+    actor_ids = [random.randrange(actors) for i in range(repeat)]
+    movie_ids = [random.randrange(movies) for i in range(repeat)]
+    return {
+        'movies of an actor': timed(
+            engine, 'SELECT movie_id FROM %s WHERE actor_id = :value' % table, actor_ids),
+        'actors of a movie': timed(
+            engine, 'SELECT actor_id FROM %s WHERE movie_id = :value' % table, movie_ids),
+        'delete a movie assignments': timed(
+            engine, 'DELETE FROM %s WHERE movie_id = :value' % table, movie_ids),
+        'delete an actor assignments': timed(
+            engine, 'DELETE FROM %s WHERE actor_id = :value' % table, actor_ids),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--actors', type=int, default=20000)
+    parser.add_argument('--cast', type=int, default=50, help='actors per movie')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    args = parser.parse_args()
+    engine = create_engine(args.database_url)
+    movies = args.rows // args.cast + 1
+    seed(engine, args.rows, args.actors, args.cast)
+    try:
+        without_indexes = measure(engine, args.actors, movies, args.repeat)
+        create_indexes(engine)
+        with_indexes = measure(engine, args.actors, movies, args.repeat)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text('DROP TABLE IF EXISTS %s' % table))
+    print('%s rows, median / max latency in ms' % args.rows)
+    print('%-30s %22s %22s' % ('', 'without indexes', 'with indexes'))
+    for name in without_indexes:
+        print('%-30s %10.3f / %9.3f %10.3f / %9.3f' % ((name,) + without_indexes[name] + with_indexes[name]))
+
+if __name__ == '__main__':
+    main()
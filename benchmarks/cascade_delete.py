@@ -0,0 +1,97 @@
+'''
+Latency of deleting a movie with a large cast, the former ORM cascade
+(assignments loaded then deleted by the session) against the foreign keys
+ON DELETE CASCADE of delete_entities()
+
+usage:
+    python benchmarks/cascade_delete.py [--cast 5000] [--repeat 20]
+
+runs on an in-memory SQLite database by default, --database-url points it
+to an empty database instead (its tables are created then dropped)
+each delete is rolled back, every run deletes the same movie
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import event
+from app import create_app
+from models import db, Actor, Movie, Assigning_actors_movies, Gender, delete_entities
+
+def seed(cast):
+    db.session.execute(Movie.__table__.insert(), [
+        {'id': 1, 'title': 'movie 1', 'release_date': datetime(2020, 5, 3, 23, tzinfo=timezone.utc)}
+    ])
+    db.session.execute(Actor.__table__.insert(), [
+        {'id': id, 'name': 'actor %s' % id, 'age': 20 + id % 50, 'gender': Gender(id % 2 + 1).name}
+        for id in range(1, cast + 1)
+    ])
+    db.session.execute(Assigning_actors_movies.__table__.insert(), [
+        {'actor_id': id, 'movie_id': 1} for id in range(1, cast + 1)
+    ])
+    db.session.commit()
+
+def orm_cascade():
+    # what session.delete() did without passive deletes
+    movie = Movie.query.get(1)
+    for assignment in movie.actors:
+        db.session.delete(assignment)
+    db.session.delete(movie)
+    db.session.flush()
+
+def database_cascade():
+    delete_entities(Movie, [1])
+
+'''
+timed(delete, repeat)
+    median milliseconds and statements of `delete`, rolled back after each run
+'''
+def timed(delete, repeat):
+    durations = []
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        for i in range(repeat):
+            del statements[:]
+            start = time.perf_counter()
+            delete()
+            durations.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+            db.session.expunge_all()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return statistics.median(durations), len(statements)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cast', type=int, default=5000, help='actors of the deleted movie')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    with app.app_context():
+        db.create_all()
+        try:
+            seed(args.cast)
+            results = {
+                'ORM cascade': timed(orm_cascade, args.repeat),
+                'ON DELETE CASCADE': timed(database_cascade, args.repeat),
+            }
+        finally:
+            db.session.remove()
+            db.drop_all()
+    print('movie with %s cast rows, median of %s deletes' % (args.cast, args.repeat))
+    print('%-20s %10s %12s' % ('', 'ms', 'statements'))
+    for name, (duration, statements) in results.items():
+        print('%-20s %10.1f %12s' % (name, duration, statements))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Startup import report of the application, from `python -X importtime`
+
+usage:
+    python benchmarks/importtime.py [--module app] [--runs 5] [--top 15]
+
+imports `--module` in fresh interpreters and prints the median total
+import time, the packages costing the most (own import time of all
+their modules) and whether the modules deferred out of the request
+serving path (migrations tooling, jose) were imported anyway
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules only manage.py (migrations) or the first token verification should import
+deferred = ('flask_migrate', 'alembic', 'flask_script', 'jose')
+
+'''
+import_times(module)
+    {imported module: own import time in microseconds} of `import module`
+'''
+def import_times(module):
+    environment = dict(os.environ)
+    environment.setdefault('DATABASE_URL', 'sqlite://')
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        cwd=root, env=environment, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    ).stderr.decode()
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(own)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    runs = [import_times(args.module) for i in range(args.runs)]
+    totals = [sum(times.values()) for times in runs]
+    packages = {}
+    for times in runs:
+        for name, own in times.items():
+            packages.setdefault(name.split('.')[0], []).append(own)
+    package_times = {
+        package: sum(values) / args.runs for package, values in packages.items()
+    }
+    print('import %s: %.1f ms (median of %s runs), %s modules' % (
+        args.module, statistics.median(totals) / 1000, args.runs, len(runs[0])))
+    print()
+    print('%-30s %10s' % ('package', 'ms'))
+    for package, own in sorted(package_times.items(), key=lambda item: -item[1])[:args.top]:
+        print('%-30s %10.1f' % (package, own / 1000))
+    print()
+    for module in deferred:
+        print('%-30s %s' % (module, 'imported' if module in packages else 'not imported'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+Throughput and latency of running servers under concurrent clients,
+e.g. the sync gunicorn workers against the ASGI entry point
+
+usage:
+    gunicorn app:app --workers 4 --bind :8000 &
+    uvicorn asgi:app --workers 4 --port 8001 &
+    python benchmarks/load.py --token $TOKEN \
+        sync=http://localhost:8000/actors?limit=20 asgi=http://localhost:8001/actors?limit=20
+
+each target gets `--clients` (200) keep-alive connections sending GET
+requests back to back for `--duration` seconds
+'''
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    if lines[0].startswith('HTTP/1.0'):
+        return status, headers.get('connection', '').lower() == 'keep-alive'
+    return status, headers.get('connection', '').lower() != 'close'
+
+async def client(url, token, deadline, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    request = (
+        'GET %s HTTP/1.1\r\nHost: %s\r\nAuthorization: Bearer %s\r\n\r\n'
+        % (path or '/', parts.netloc, token)
+    ).encode()
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            start = time.perf_counter()
+            writer.write(request)
+            status, keep_alive = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+async def load(url, token, clients, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[
+        client(url, token, deadline, latencies, errors) for i in range(clients)
+    ])
+    return latencies, errors
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('targets', nargs='+', help='name=url')
+    parser.add_argument('--token', default='', help='bearer token sent with every request')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    print('%s clients, %ss per target' % (args.clients, args.duration))
+    print('%-10s %10s %10s %10s %10s %8s' % ('', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'errors'))
+    for target in args.targets:
+        name, url = target.split('=', 1) if '=' in target.split('://')[0] else (target, target)
+        latencies, errors = asyncio.run(load(url, args.token, args.clients, args.duration))
+        latencies.sort()
+        if not latencies:
+            print('%-10s no response (%s errors)' % (name, len(errors)))
+            continue
+        print('%-10s %10.1f %10.1f %10.1f %10.1f %8s' % (
+            name, len(latencies) / args.duration, percentile(latencies, 0.5),
+            percentile(latencies, 0.9), percentile(latencies, 0.99), len(errors)))
+
+if __name__ == '__main__':
+    main()
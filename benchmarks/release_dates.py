@@ -0,0 +1,85 @@
+'''
+Parsing and formatting cost of movies release dates, strptime() and
+strftime() against parse_release_date() and format_release_date() of
+dates.py
+
+usage:
+    python benchmarks/release_dates.py [--dates 200000] [--repeat 5]
+
+parses `--dates` legacy ("3/5/2020 23:05 UTC+01") and ISO 8601
+("2020-05-03T23:05+01:00") release dates spread over a few offsets, as a
+bulk import does, then formats them back
+'''
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dates import parse_release_date, format_release_date
+
+offsets = ('+00', '+01', '+02', '-04', '-07', '+09')
+
+def legacy_dates(count):
+    return [
+        '%d/%d/%d %d:%02d UTC%s' % (
+            random.randint(1, 28), random.randint(1, 12), random.randint(1950, 2030),
+            random.randint(0, 23), random.randint(0, 59), random.choice(offsets))
+        for i in range(count)
+    ]
+
+def iso_dates(count):
+    return [
+        '%04d-%02d-%02dT%02d:%02d%s:00' % (
+            random.randint(1950, 2030), random.randint(1, 12), random.randint(1, 28),
+            random.randint(0, 23), random.randint(0, 59), random.choice(offsets))
+        for i in range(count)
+    ]
+
+def strptime_legacy(value):
+    return datetime.strptime(value + '00', '%d/%m/%Y %H:%M UTC%z')
+
+def strptime_iso(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M%z')
+
+def strftime_format(value):
+    return value.strftime('%d/%m/%Y %H:%M UTC%z')[0:-2]
+
+def timed(function, values, repeat):
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for value in values:
+            function(value)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dates', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    legacy = legacy_dates(args.dates)
+    iso = iso_dates(args.dates)
+    parsed = [parse_release_date(value) for value in legacy]
+    assert parsed == [strptime_legacy(value) for value in legacy]
+    assert [parse_release_date(value) for value in iso] == [strptime_iso(value) for value in iso]
+    assert [format_release_date(value) for value in parsed] == [strftime_format(value) for value in parsed]
+    cases = {
+        'parse legacy': (strptime_legacy, parse_release_date, legacy),
+        'parse ISO 8601': (strptime_iso, parse_release_date, iso),
+        'format': (strftime_format, format_release_date, parsed),
+    }
+    print('%s release dates, median seconds' % args.dates)
+    print('%-16s %12s %12s %8s %14s' % ('', 'stdlib', 'dates.py', 'speedup', 'dates / s'))
+    for name, (stdlib, fast, values) in cases.items():
+        stdlib_s = timed(stdlib, values, args.repeat)
+        fast_s = timed(fast, values, args.repeat)
+        print('%-16s %12.3f %12.3f %7.1fx %14.0f' % (name, stdlib_s, fast_s, stdlib_s / fast_s, len(values) / fast_s))
+
+if __name__ == '__main__':
+    main()
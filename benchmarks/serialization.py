@@ -0,0 +1,100 @@
+'''
+Serialization cost of the actors and movies listings, the former
+ORM instances + format() + jsonify path against the columns tuples
+path of serializers.py
+
+usage:
+    python benchmarks/serialization.py [--rows 10000] [--repeat 5]
+
+runs on an in-memory SQLite database by default, --database-url points it
+to an empty database instead (its tables are created then dropped)
+each run reads the rows and their associations then encodes the JSON body
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import jsonify
+from app import create_app
+from models import db, Actor, Movie, Assigning_actors_movies, Gender
+import serializers
+
+def seed(rows, cast):
+    release_date = datetime(2020, 5, 3, 23, tzinfo=timezone(timedelta(hours=1)))
+    db.session.execute(Movie.__table__.insert(), [
+        {'id': id, 'title': 'movie %s' % id, 'release_date': release_date}
+        for id in range(1, rows + 1)
+    ])
+    db.session.execute(Actor.__table__.insert(), [
+        {'id': id, 'name': 'actor %s' % id, 'age': 20 + id % 50, 'gender': Gender(id % 2 + 1).name}
+        for id in range(1, rows + 1)
+    ])
+    db.session.execute(Assigning_actors_movies.__table__.insert(), [
+        {'actor_id': id, 'movie_id': (id + n) % rows + 1}
+        for id in range(1, rows + 1)
+        for n in range(cast)
+    ])
+    db.session.commit()
+
+def timed(function, repeat):
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+def measure(model, key, columns, format_rows, repeat):
+    relationship = getattr(model, 'actors' if model is Movie else 'movies')
+
+    def legacy():
+        instances = model.query.options(db.selectinload(relationship)).order_by(model.id).all()
+        body = jsonify({
+            'success': True,
+            key: [instance.format() for instance in instances]
+        }).get_data()
+        db.session.expunge_all()
+        return body
+
+    def fast():
+        rows = db.session.query(*columns).order_by(model.id).all()
+        return serializers.dumps({
+            'success': True,
+            key: format_rows(rows)
+        })
+
+    return timed(legacy, repeat), timed(fast, repeat)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--cast', type=int, default=3, help='movies per actor')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    with app.app_context():
+        db.create_all()
+        try:
+            seed(args.rows, args.cast)
+            results = {
+                'actors': measure(Actor, 'actors', serializers.actor_columns, serializers.format_actors, args.repeat),
+                'movies': measure(Movie, 'movies', serializers.movie_columns, serializers.format_movies, args.repeat),
+            }
+        finally:
+            db.session.remove()
+            db.drop_all()
+    print('%s rows, json encoder: %s, median ms' % (
+        args.rows, 'orjson' if serializers.orjson is not None else 'json'))
+    print('%-10s %12s %12s %8s' % ('', 'format()', 'serializers', 'speedup'))
+    for name, (legacy, fast) in results.items():
+        print('%-10s %12.1f %12.1f %7.1fx' % (name, legacy, fast, legacy / fast))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+Cold start of the application: time to import it, to create the app and
+to serve its first request, and the peak memory of the process, each
+measured in a fresh interpreter
+
+usage:
+    python benchmarks/startup.py [--runs 10] [--database-url sqlite://]
+
+with a preloaded gunicorn (gunicorn.conf.py) the import and creation are
+paid once by the master, the workers only pay the first request
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+probe = '''
+import json, resource, time
+start = time.perf_counter()
+import app as application
+imported = time.perf_counter()
+flask_app = application.app
+created = time.perf_counter()
+flask_app.test_client().get('/health')
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first request': served - created,
+    'total': served - start,
+    'max rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+'''
+
+def run(database_url):
+    environment = dict(os.environ, DATABASE_URL=database_url)
+    output = subprocess.run(
+        [sys.executable, '-c', probe], cwd=root, env=environment,
+        check=True, stdout=subprocess.PIPE
+    ).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+    results = [run(args.database_url) for i in range(args.runs)]
+    print('%s runs, median ms' % args.runs)
+    for phase in ('import', 'create_app', 'first request', 'total'):
+        print('%-15s %8.1f' % (phase, statistics.median(result[phase] for result in results) * 1000))
+    print('%-15s %8.1f MB' % ('max rss', max(result['max rss'] for result in results) / 1024))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+'''
+Validation cost of the actors and movies payloads, the former
+verify_*_submitted_info() functions (copied below) against the compiled
+schemas of validators.py
+
+usage:
+    python benchmarks/validation.py [--items 5000] [--ids 20] [--repeat 5]
+
+each case validates `--items` payloads, as a bulk request does, with
+`--ids` linked ids per payload, and includes the conversions the endpoints
+did after the former checks (gender, release date, missing fields)
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from models import ActionError, Assigning_actors_movies, Gender, actor_name_length, movie_title_length
+from endpoints_errors import actor_name_error, actor_age_error, actor_gender_error, actor_movies_error
+from endpoints_errors import movie_title_error, movie_actors_error, movie_release_date_error
+from validators import actor_schema, movie_schema
+
+def verify_actor_submitted_info(name, age, gender, movies):
+    if name is not None and (type(name) != str or len(name) > actor_name_length):
+        raise actor_name_error
+    if age is not None and (type(age) != int or age < 18 or age > 100):
+        raise actor_age_error
+    if gender is not None and (type(gender) != str or gender.lower() not in ['male', 'female']):
+        raise actor_gender_error
+    actors_movies = []
+    if movies is not None:
+        if type(movies) != list: raise actor_movies_error
+        for movie_id in movies:
+            if type(movie_id) != int:
+                raise actor_movies_error
+        for movie_id in dict.fromkeys(movies):
+            actors_movies.append(Assigning_actors_movies(movie_id=movie_id))
+    return actors_movies
+
+def verify_movie_submitted_info(title, release_date, actors):
+    if title is not None and (type(title) != str or len(title) > movie_title_length):
+        raise movie_title_error
+    long_datetime = '02/05/2020 22:33 UTC+01'
+    short_datetime= '2/5/2020 4:3 UTC+01'
+    if release_date is not None:
+        if( type(release_date) != str or len(release_date) > len(long_datetime)
+            or len(release_date) < len(short_datetime) ):
+            raise movie_release_date_error
+    actors_movies = []
+    if actors is not None:
+        if type(actors) != list: raise movie_actors_error
+        for actor_id in actors:
+            if type(actor_id) != int:
+                raise movie_actors_error
+        for actor_id in dict.fromkeys(actors):
+            actors_movies.append(Assigning_actors_movies(actor_id=actor_id))
+    return actors_movies
+
+def legacy_actor(item):
+    movies = verify_actor_submitted_info(item.get('name'), item.get('age'), item.get('gender'), item.get('movies', []))
+    for attribute in ('name', 'age', 'gender'):
+        if item.get(attribute) is None:
+            raise ActionError({'error': 'missing actor informations', 'description': '`%s` is required' % attribute}, 422)
+    return Gender[item['gender'].lower()], movies
+
+def legacy_movie(item):
+    actors = verify_movie_submitted_info(item.get('title'), item.get('release_date'), item.get('actors', []))
+    for attribute in ('title', 'release_date'):
+        if item.get(attribute) is None:
+            raise ActionError({'error': 'missing movie informations', 'description': '`%s` is required' % attribute}, 422)
+    try:
+        release_date = datetime.strptime(item['release_date'] + '00', '%d/%m/%Y %H:%M UTC%z')
+    except ValueError:
+        raise movie_release_date_error
+    return release_date, actors
+
+def validated(validate, items):
+    errors = 0
+    for item in items:
+        try:
+            validate(item)
+        except ActionError:
+            errors += 1
+    return errors
+
+def timed(validate, items, repeat):
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        validated(validate, items)
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--ids', type=int, default=20, help='linked ids per payload')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    ids = list(range(1, args.ids + 1))
+    cases = {
+        'valid actors': (legacy_actor, actor_schema.validate, [
+            {'name': 'actor %s' % i, 'age': 30, 'gender': 'female', 'movies': ids}
+            for i in range(args.items)
+        ]),
+        'valid movies': (legacy_movie, movie_schema.validate, [
+            {'title': 'movie %s' % i, 'release_date': '03/05/2020 23:00 UTC+01', 'actors': ids}
+            for i in range(args.items)
+        ]),
+        'invalid actors': (legacy_actor, actor_schema.validate, [
+            {'name': 'actor %s' % i, 'age': 30, 'gender': 'female', 'movies': ids + ['1']}
+            for i in range(args.items)
+        ]),
+    }
+    print('%s payloads, %s ids each, median ms' % (args.items, args.ids))
+    print('%-16s %12s %12s %8s' % ('', 'verify_*()', 'schemas', 'speedup'))
+    for name, (legacy, validate, items) in cases.items():
+        legacy_ms = timed(legacy, items, args.repeat)
+        schema_ms = timed(validate, items, args.repeat)
+        print('%-16s %12.1f %12.1f %7.1fx' % (name, legacy_ms, schema_ms, legacy_ms / schema_ms))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+from sqlalchemy.exc import IntegrityError
+from models import db, Actor, Movie, Assigning_actors_movies, ActionError
+from models import chunks, find_missing_ids, mark_changed, assigned_tables
+from models import ids_filter, is_postgresql, delete_entities, insert_values
+from endpoints_errors import max_bulk_items
+from endpoints_errors import missing_references_error, bulk_delete_error
+from validators import actor_schema, movie_schema
+
+'''
+bulk_items(body, key, error)
+    the records of a bulk request, sent either as a JSON list
+    or as an object holding the list under `key`, raises `error` otherwise
+'''
+def bulk_items(body, key, error):
+    if type(body) == dict:
+        body = body.get(key)
+    if type(body) != list or len(body) == 0 or len(body) > max_bulk_items:
+        raise error
+    return body
+
+def item_error(index, error):
+    return dict(error, index=index)
+
+'''
+existing_values(column, values)
+    the subset of `values` already stored in `column`, one query per in_clause_size values
+'''
+def existing_values(column, values):
+    existing = set()
+    for chunk in chunks(values):
+        existing.update(value for value, in db.session.query(column).filter(column.in_(chunk)))
+    return existing
+
+'''
+check_references(items_ids, model, resource, owner, errors)
+    reports, per item, the referenced ids missing from `model` table
+'''
+def check_references(items_ids, model, resource, owner, errors):
+    referenced = set()
+    for ids in items_ids.values():
+        referenced.update(ids)
+    missing = find_missing_ids(model, referenced)
+    if not missing:
+        return
+    for index, ids in items_ids.items():
+        missing_ids = set(ids) & missing
+        if missing_ids:
+            errors.append(item_error(index, missing_references_error(resource, owner, missing_ids).error))
+
+'''
+insert_all(model, key_column, rows, links, link_column)
+    inserts all the rows then their associations with multi-row statements,
+    in the request transaction
+    `key_column` is the unique column used to read the generated ids back
+    returns the created ids in the order of `rows`
+'''
+def insert_all(model, key_column, rows, links, link_column):
+    try:
+        return insert_rows(model, key_column, rows, links, link_column)
+    except IntegrityError:
+        # a concurrent request created a conflicting record meanwhile,
+        # the error response rolls the whole request back
+        raise ActionError({
+            'error': 'integrity error',
+            'description': 'Conflicting records were created meanwhile, nothing was created'
+        }, 422)
+
+def insert_rows(model, key_column, rows, links, link_column):
+    insert_values(model.__table__, rows)
+    keys = [row[key_column.key] for row in rows]
+    ids = {}
+    for chunk in chunks(keys):
+        ids.update(db.session.query(key_column, model.id).filter(key_column.in_(chunk)))
+    created = [ids[key] for key in keys]
+    owner_column = 'movie_id' if link_column == 'actor_id' else 'actor_id'
+    assignments = [
+        {owner_column: owner_id, link_column: linked_id}
+        for owner_id, linked_ids in zip(created, links)
+        for linked_id in linked_ids
+    ]
+    if assignments:
+        insert_values(Assigning_actors_movies.__table__, assignments)
+        mark_changed('actors_movies')
+        mark_changed(assigned_tables[link_column], {row[link_column] for row in assignments})
+    mark_changed(model.__tablename__, created)
+    return created
+
+def raise_item_errors(errors, resources):
+    errors.sort(key=lambda error: error['index'])
+    raise ActionError({
+        'error': 'invalide %s informations' % resources,
+        'description': '%s item[s] rejected, nothing was created' % len(errors),
+        'errors': errors
+    }, 422)
+
+'''
+bulk_create_actors(items)
+    validates all the actors first, reporting errors per item index,
+    creates them only if all are valid
+'''
+def bulk_create_actors(items):
+    errors = []
+    rows, links, movies_ids = [], [], {}
+    names = {}
+    for index, item in enumerate(items):
+        try:
+            actor = actor_schema.validate(item)
+        except ActionError as e:
+            errors.append(item_error(index, e.error))
+            continue
+        name = actor['name']
+        if name in names:
+            errors.append(item_error(index, {
+                'error': 'integrity error',
+                'description': 'Duplicated actor name, actor `%s` is also item %s' % (name, names[name])
+            }))
+            continue
+        names[name] = index
+        movies = actor.get('movies', ())
+        movies_ids[index] = movies
+        rows.append({'name': name, 'age': actor['age'], 'gender': actor['gender']})
+        links.append(movies)
+    for name in existing_values(Actor.name, names):
+        errors.append(item_error(names[name], {
+            'error': 'integrity error',
+            'description': 'Duplicated actor name, actor `%s` alrady exists' % name
+        }))
+    check_references(movies_ids, Movie, 'movie', 'actor', errors)
+    if errors:
+        raise_item_errors(errors, 'actors')
+    return insert_all(Actor, Actor.name, rows, links, 'movie_id')
+
+'''
+bulk_create_movies(items)
+    validates all the movies first, reporting errors per item index,
+    creates them only if all are valid
+'''
+def bulk_create_movies(items):
+    errors = []
+    rows, links, actors_ids = [], [], {}
+    titles = {}
+    for index, item in enumerate(items):
+        try:
+            movie = movie_schema.validate(item)
+        except ActionError as e:
+            errors.append(item_error(index, e.error))
+            continue
+        title = movie['title']
+        if title in titles:
+            errors.append(item_error(index, {
+                'error': 'integrity error',
+                'description': 'Duplicated movie title, movie `%s` is also item %s' % (title, titles[title])
+            }))
+            continue
+        titles[title] = index
+        actors = movie.get('actors', ())
+        actors_ids[index] = actors
+        rows.append({'title': title, 'release_date': movie['release_date']})
+        links.append(actors)
+    for title in existing_values(Movie.title, titles):
+        errors.append(item_error(titles[title], {
+            'error': 'integrity error',
+            'description': 'Duplicated movie title, movie `%s` alrady exists' % title
+        }))
+    check_references(actors_ids, Actor, 'actor', 'movie', errors)
+    if errors:
+        raise_item_errors(errors, 'movies')
+    return insert_all(Movie, Movie.title, rows, links, 'actor_id')
+
+'''
+delete_ids(body)
+    the ids of a bulk delete, sent either as a JSON list or as an object
+    holding the list under `ids`, None when the request has no body
+'''
+def delete_ids(body):
+    if body is None:
+        return None
+    if type(body) == dict:
+        body = body.get('ids')
+    if type(body) != list or len(body) == 0 or len(body) > max_bulk_items:
+        raise bulk_delete_error
+    if any(type(id) != int for id in body):
+        raise bulk_delete_error
+    return list(dict.fromkeys(body))
+
+'''
+bulk_delete(model, ids, conditions)
+    deletes the `model` rows of `ids` (any row when None) matching all the
+    `conditions`, the matching ids are read and locked with one query then
+    deleted with their assignments (ON DELETE CASCADE) by one statement,
+    on postgres (in_clause_size chunks elsewhere)
+    returns (deleted ids, missing ids), the ids sent having no matching row
+'''
+def bulk_delete(model, ids, conditions):
+    query = db.session.query(model.id).filter(*conditions).with_for_update()
+    if ids is None:
+        deleted = [id for id, in query.order_by(model.id)]
+    else:
+        found = set()
+        for batch in [ids] if is_postgresql() else chunks(ids):
+            found.update(id for id, in query.filter(ids_filter(model.id, batch)))
+        deleted = sorted(found)
+    if deleted:
+        for batch in [deleted] if is_postgresql() else chunks(deleted):
+            delete_entities(model, batch)
+    missing = [] if ids is None else sorted(set(ids) - set(deleted))
+    return deleted, missing
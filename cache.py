@@ -0,0 +1,153 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+'''
+LRUCache
+    a bounded, thread safe, least recently used mapping
+    entries may carry an absolute expiry timestamp (`expires_at`, same
+    clock as `clock`) after which they are dropped on access
+    hits, misses, evictions and expirations are counted for monitoring
+'''
+class LRUCache:
+    def __init__(self, maxsize=1024, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+'''
+ResponseCache
+    serialized GET payloads, keyed by table (and row id for single
+    entities) and query parameters
+    `backend` stores the entries, any object with the LRUCache get/set/delete/clear
+    methods will do (in-process LRUCache now, a shared store later)
+    entries are never deleted one by one: each table, and each of its rows,
+    has a generation token stored in the backend along with the entries and
+    part of their keys, invalidate(changes) drops the tokens of the changed
+    tables and rows so their previous entries can't be read anymore and
+    age out of the backend
+'''
+class ResponseCache:
+    def __init__(self, backend, ttl=None, clock=time.time):
+        self.backend = backend
+        self.ttl = ttl
+        self.clock = clock
+
+    def _generation(self, key):
+        generation = self.backend.get(key)
+        if generation is None:
+            # never fall back to a default token, entries written under an
+            # evicted generation must stay unreachable
+            generation = self._new_generation(key)
+        return generation
+
+    def _new_generation(self, key):
+        generation = uuid.uuid4().hex
+        self.backend.set(key, generation)
+        return generation
+
+    def key(self, table, params, id=None):
+        generation = self._generation(('generation', table))
+        if id is not None:
+            generation = (
+                self._generation(('generation', table, 'rows')),
+                self._generation(('generation', table, id))
+            )
+        return ('response', table, id, generation, params)
+
+    '''
+    lookup(table, params, id=None)
+        returns (key, body), body is None on a miss
+        the key is taken before the payload is built: store(key, body) then
+        files it under the generation it was read from, so a payload
+        racing with a write can't outlive the invalidation
+    '''
+    def lookup(self, table, params, id=None):
+        key = self.key(table, params, id)
+        return key, self.backend.get(key)
+
+    def store(self, key, body):
+        expires_at = None if not self.ttl else self.clock() + self.ttl
+        self.backend.set(key, body, expires_at=expires_at)
+
+    def invalidate(self, changes):
+        # a dropped generation is replaced by a new token on its next read
+        for table, ids in changes.items():
+            self.backend.delete(('generation', table))
+            if ids is None:
+                self.backend.delete(('generation', table, 'rows'))
+            else:
+                for id in ids:
+                    self.backend.delete(('generation', table, id))
+
+    def clear(self):
+        self.backend.clear()
+
+'''
+params_key(args)
+    hashable, order independent key of a request query string
+'''
+def params_key(args):
+    return tuple(sorted(args.items(multi=True)))
+
+'''
+make_etag(table, version, params)
+    strong entity tag of a `table` payload at `version` for the query `params`
+'''
+def make_etag(table, version, params):
+    digest = hashlib.blake2b(repr((table, version, params)).encode(), digest_size=16)
+    return digest.hexdigest()
@@ -0,0 +1,86 @@
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+'''
+release dates formatting
+    movies release dates are exposed as "%d/%m/%Y %H:%M UTC±HH", the same
+    text as strftime('%d/%m/%Y %H:%M UTC%z')[0:-2], built without strftime
+    the "UTC±HH" label is computed once per utc offset
+'''
+@lru_cache(maxsize=64)
+def offset_label(offset):
+    if offset is None:
+        # naive datetimes are taken as UTC (see models.UTCDateTime)
+        offset = timedelta(0)
+    minutes = int(offset.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    return 'UTC%s%02d' % (sign, abs(minutes) // 60)
+
+def format_release_date(release_date):
+    return '%02d/%02d/%04d %02d:%02d %s' % (
+        release_date.day,
+        release_date.month,
+        release_date.year,
+        release_date.hour,
+        release_date.minute,
+        offset_label(release_date.utcoffset())
+    )
+
+'''
+release dates parsing
+    parse_release_date(value) accepts the legacy "%d/%m/%Y %H:%M UTC±HH"
+    text (leading zeros optional) and ISO 8601 datetimes
+    ("2020-05-03T23:00+01:00", "2020-05-03 23:00:00Z", "2020-05-03", UTC
+    when no offset is given), it returns an aware datetime, None when
+    `value` is neither
+    both are matched with a single regular expression, the timezone
+    objects are built once per utc offset and shared by all the parsed
+    datetimes
+'''
+legacy_release_date = re.compile(
+    r'(\d{1,2})/(\d{1,2})/(\d{4}) (\d{1,2}):(\d{1,2}) UTC([+-])(\d{2})\Z'
+)
+iso_release_date = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?)?'
+    r'(?:(Z)|([+-])(\d{2})(?::?(\d{2}))?)?\Z'
+)
+
+@lru_cache(maxsize=128)
+def offset_timezone(minutes):
+    if minutes == 0:
+        return timezone.utc
+    return timezone(timedelta(minutes=minutes))
+
+def parse_release_date(value):
+    if type(value) is not str:
+        return None
+    try:
+        match = legacy_release_date.match(value)
+        if match is not None:
+            day, month, year, hour, minute, sign, offset_hours = match.groups()
+            minutes = int(offset_hours) * 60
+            return datetime(
+                int(year), int(month), int(day), int(hour), int(minute),
+                tzinfo=offset_timezone(-minutes if sign == '-' else minutes)
+            )
+        match = iso_release_date.match(value)
+        if match is not None:
+            (year, month, day, hour, minute, second, fraction,
+                utc, sign, offset_hours, offset_minutes) = match.groups()
+            minutes = 0
+            if sign is not None:
+                minutes = int(offset_hours) * 60 + int(offset_minutes or 0)
+                if sign == '-':
+                    minutes = -minutes
+            return datetime(
+                int(year), int(month), int(day),
+                int(hour or 0), int(minute or 0), int(second or 0),
+                int(fraction.ljust(6, '0')) if fraction else 0,
+                tzinfo=offset_timezone(minutes)
+            )
+    except ValueError:
+        # out of range day, month, hour... or offset
+        pass
+    return None
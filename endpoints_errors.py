@@ -1,5 +1,16 @@
-from models import ActionError, Assigning_actors_movies
+from models import ActionError
 from models import actor_name_length, movie_title_length
+import os
+
+# largest page a client may request with `limit`
+max_page_size = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+
+# largest number of records accepted by a bulk endpoint
+max_bulk_items = int(os.environ.get('MAX_BULK_ITEMS', 5000))
+
+# longest search query, and deepest search result a client may request (offset + limit)
+max_search_query_length = 100
+max_search_window = int(os.environ.get('MAX_SEARCH_WINDOW', 100))
 
 '''
 endpoints actions common errors
@@ -49,40 +60,106 @@ movie_release_date_error = ActionError({
         'description': '`release_date` malformatted'
         }, 422)
 
+page_limit_error = ActionError({
+        'error': 'invalide pagination parameters',
+        'description': '`limit` must be an integer in the interval [1;%s]'% str(max_page_size)
+        }, 422)
+
+page_cursor_error = ActionError({
+        'error': 'invalide pagination parameters',
+        'description': '`after` must be a cursor returned as `next_cursor`'
+        }, 422)
+
+bulk_actors_error = ActionError({
+        'error': 'invalide bulk actors',
+        'description': 'request body must be a list of 1 to %s actors'% str(max_bulk_items)
+        }, 422)
+
+bulk_movies_error = ActionError({
+        'error': 'invalide bulk movies',
+        'description': 'request body must be a list of 1 to %s movies'% str(max_bulk_items)
+        }, 422)
+
+commit_conflict_error = ActionError({
+        'error': 'integrity error',
+        'description': 'Conflicting records were written meanwhile, nothing was written'
+        }, 422)
+
+bulk_delete_error = ActionError({
+        'error': 'invalide bulk delete',
+        'description': 'request must send a list of 1 to %s ids, as its body or its `ids`, and/or listing filters'% str(max_bulk_items)
+        }, 422)
+
+'''
+missing_references_error(resource, owner, ids)
+    error reporting the referenced `resource` ids missing from the database
+'''
+def missing_references_error(resource, owner, ids):
+    return ActionError({
+        'error': 'integrity error',
+        'description': 'Referenced %s[s] %s does not exist in the database, \
+confim their ids before assign to %s'% (resource, sorted(ids), owner)
+        }, 422)
+
+'''
+invalid_fields_error(resource, errors)
+    error reporting the rejected and missing fields of a `resource`
+'''
+def invalid_fields_error(resource, errors):
+    return ActionError({
+        'error': 'invalide %s informations'% resource,
+        'description': '%s fields rejected'% len(errors),
+        'errors': errors
+        }, 422)
+
+'''
+include_error(allowed)
+    error reporting an `include` value out of the `allowed` related resources
+'''
+def include_error(allowed):
+    return ActionError({
+        'error': 'invalide include parameter',
+        'description': '`include` accepts only %s'% ', '.join('`%s`'% value for value in allowed)
+        }, 422)
+
+'''
+filter_error(name, expected) / sort_error(allowed) / fields_error(allowed)
+    errors reporting an invalid listing query parameter
+'''
+def filter_error(name, expected):
+    return ActionError({
+        'error': 'invalide filter parameter',
+        'description': '`%s` must be %s'% (name, expected)
+        }, 422)
+
+def sort_error(allowed):
+    return ActionError({
+        'error': 'invalide sort parameter',
+        'description': '`sort` accepts only %s, prefixed with `-` for a descending order'% ', '.join('`%s`'% value for value in allowed)
+        }, 422)
+
+def fields_error(allowed):
+    return ActionError({
+        'error': 'invalide fields parameter',
+        'description': '`fields` accepts only %s'% ', '.join('`%s`'% value for value in allowed)
+        }, 422)
+
+search_query_error = ActionError({
+        'error': 'invalide search parameters',
+        'description': '`q` must be a non empty string of at most %s characters'% str(max_search_query_length)
+        }, 422)
 
+search_type_error = ActionError({
+        'error': 'invalide search parameters',
+        'description': '`type` accepts only `actors` and `movies` the token is allowed to get'
+        }, 422)
 
-# verify actor submitted informations
-def verify_actor_submitted_info(name, age, gender, movies):
-    if name is not None and (type(name) != str or len(name) > actor_name_length):
-        raise actor_name_error
-    if age is not None and (type(age) != int or age < 18 or age > 100):
-        raise actor_age_error
-    if gender is not None and (type(gender) != str or gender.lower() not in ['male', 'female']):
-        raise actor_gender_error
-    actors_movies = []
-    if movies is not None:
-        if type(movies) != list: raise actor_movies_error
-        for movie_id in movies:
-            if type(movie_id) != int:
-                raise actor_movies_error
-            actors_movies.append(Assigning_actors_movies(movie_id=movie_id))
-    return actors_movies
-
-# verify movie submitted informations
-def verify_movie_submitted_info(title, release_date, actors):
-    if title is not None and (type(title) != str or len(title) > movie_title_length):
-        raise movie_title_error
-    long_datetime = '02/05/2020 22:33 UTC+01'
-    short_datetime= '2/5/2020 4:3 UTC+01'
-    if release_date is not None:
-        if( type(release_date) != str or len(release_date) > len(long_datetime)
-            or len(release_date) < len(short_datetime) ):
-            raise movie_release_date_error
-    actors_movies = []
-    if actors is not None:
-        if type(actors) != list: raise movie_actors_error
-        for actor_id in actors:
-            if type(actor_id) != int:
-                raise movie_actors_error
-            actors_movies.append(Assigning_actors_movies(actor_id=actor_id))
-    return actors_movies
\ No newline at end of file
+search_window_error = ActionError({
+        'error': 'invalide search parameters',
+        'description': '`limit` must be positive, `offset` positive or zero, and offset + limit at most %s'% str(max_search_window)
+        }, 422)
+
+stream_format_error = ActionError({
+        'error': 'invalide streaming parameters',
+        'description': '`stream` accepts only two values `ndjson` and `json`'
+        }, 422)
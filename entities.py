@@ -0,0 +1,81 @@
+import os
+from models import db, ids_filter, table_versions
+from cache import LRUCache
+from serializers import actor_columns, movie_columns, format_actors, format_movies
+from endpoints_errors import include_error
+
+'''
+identity cache
+    formatted actors and movies (as Actor.format() / Movie.format()) by
+    primary key, keyed by their table version as well: a write to a table
+    committed by any worker makes all its cached entities unreachable
+'''
+entity_cache = LRUCache(maxsize=int(os.environ.get('ENTITY_CACHE_SIZE', 10000)))
+
+# table name -> (columns tuple, rows formatter)
+entity_layouts = {
+    'actors': (actor_columns, format_actors),
+    'movies': (movie_columns, format_movies),
+}
+
+'''
+formatted_entities(model, ids, versions=None)
+    {id: formatted entity} of the `ids` found in `model` table, the ones
+    not cached are read with a single query
+    `versions` are table versions already read by the caller
+'''
+def formatted_entities(model, ids, versions=None):
+    table = model.__tablename__
+    if versions is None:
+        versions = table_versions(table)
+    version = versions[table]
+    found, missing = {}, []
+    for id in dict.fromkeys(ids):
+        entity = entity_cache.get((table, id, version))
+        if entity is None:
+            missing.append(id)
+        else:
+            found[id] = entity
+    if missing:
+        columns, format_rows = entity_layouts[table]
+        rows = db.session.query(*columns).filter(ids_filter(model.id, missing)).all()
+        # rows read along uncommitted writes must not outlive the transaction
+        cacheable = not db.session.info.get('changes')
+        for entity in format_rows(rows):
+            found[entity['id']] = entity
+            if cacheable:
+                entity_cache.set((table, entity['id'], version), entity)
+    return found
+
+def formatted_entity(model, id, versions=None):
+    return formatted_entities(model, [id], versions).get(id)
+
+'''
+is_unchanged(entity, values)
+    whether writing `values` (None meaning not sent) would leave the
+    formatted `entity` as is, ids lists are compared as sets
+'''
+def is_unchanged(entity, values):
+    for key, value in values.items():
+        if value is None:
+            continue
+        current = entity[key]
+        if type(current) == list:
+            if set(value) != set(current):
+                return False
+        elif value != current:
+            return False
+    return True
+
+'''
+include_args(args, allowed)
+    the related resources asked with `include` (comma separated)
+'''
+def include_args(args, allowed):
+    include = args.get('include')
+    if not include:
+        return set()
+    include = set(include.split(','))
+    if not include <= set(allowed):
+        raise include_error(allowed)
+    return include
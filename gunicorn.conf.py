@@ -0,0 +1,72 @@
+'''
+gunicorn production settings
+
+usage:
+    gunicorn -c gunicorn.conf.py app:app
+
+every value can be overridden from the environment, WEB_CONCURRENCY and
+WEB_THREADS are exported before the application is loaded so each worker
+database pool is sized for its threads (see pool.py)
+'''
+import os
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# requests mostly wait on postgres and Auth0: a few processes per cpu,
+# and threads in each of them to overlap those waits
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2 * available_cpus() + 1, 8)))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['WEB_THREADS'] = str(threads)
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# the app is imported once by the master and its memory shared by the
+# forked workers (copy on write), instead of being imported by each worker
+preload_app = os.environ.get('WEB_PRELOAD', 'true').lower() == 'true'
+
+# workers are replaced after that many requests, bounding leaks and
+# fragmentation, the jitter keeps them from restarting all at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 100))
+
+def dispose_engine():
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose()
+
+def when_ready(server):
+    # readiness: the preloaded app reaches its database before workers are forked
+    if not preload_app:
+        server.log.info('Ready: %s workers x %s threads', workers, threads)
+        return
+    from app import app
+    from models import db
+    with app.app_context():
+        try:
+            db.session.execute('SELECT 1')
+            server.log.info('Ready: %s workers x %s threads, database reachable', workers, threads)
+        except Exception as e:
+            server.log.warning('Ready: %s workers x %s threads, database unreachable: %s', workers, threads, e)
+        finally:
+            db.session.remove()
+    # no connection may be inherited by the workers
+    dispose_engine()
+    # imported lazily by the first token verification, imported once here
+    # so the preloaded workers share it
+    import jose.jwt
+
+def post_fork(server, worker):
+    # connections of the master process are not shared with the worker,
+    # each worker opens its own pool
+    if preload_app:
+        dispose_engine()
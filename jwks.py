@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+'''
+JWKS sources
+    a source exposes a fetch() method returning the parsed jwks document
+    ({'keys': [...]}), it should raise on any failure so the cache can
+    fall back to the keys it already holds
+'''
+class UrlJwksSource:
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        with urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+class FileJwksSource:
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path) as jwks_file:
+            return json.load(jwks_file)
+
+class StaticJwksSource:
+    def __init__(self, jwks):
+        self.jwks = jwks
+
+    def fetch(self):
+        return self.jwks
+
+'''
+JwksError Exception
+raised when no signing key can be served, neither fresh nor stale
+'''
+class JwksError(Exception):
+    pass
+
+'''
+index_jwks(jwks)
+    builds the kid -> rsa key mapping expected by jose from a jwks document
+'''
+def index_jwks(jwks):
+    keys = {}
+    for key in jwks.get('keys', []):
+        if 'kid' not in key:
+            continue
+        keys[key['kid']] = {
+            'kty': key.get('kty'),
+            'kid': key['kid'],
+            'use': key.get('use'),
+            'n': key.get('n'),
+            'e': key.get('e')
+        }
+    return keys
+
+'''
+JwksCache
+    keeps the kid -> key index of a jwks source in memory
+    - keys are refreshed once they are older than `ttl` seconds
+    - an unknown kid forces a refresh, at most once every
+      `min_refresh_interval` seconds so forged kids can't trigger a fetch storm
+    - failed fetches are rate limited the same way, even when no key is
+      cached yet (cold start with the issuer unreachable)
+    - when the source is unreachable the previous keys are kept and served
+    - concurrent callers needing a refresh wait on a single shared fetch
+'''
+class JwksCache:
+    def __init__(self, source, ttl=600, min_refresh_interval=30, clock=time.monotonic):
+        self.source = source
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._attempts = 0
+
+    def set_source(self, source):
+        with self._lock:
+            self.source = source
+            self.clear()
+
+    def get_key(self, kid):
+        now = self.clock()
+        refreshed = False
+        if self._is_expired(now) and self._may_refresh(now):
+            self._refresh()
+            refreshed = True
+        key = self._keys.get(kid)
+        # a kid missing from the keys just fetched won't appear by refetching
+        if key is None and not refreshed and self._may_refresh(self.clock()):
+            self._refresh()
+            key = self._keys.get(kid)
+        if key is None and not self._keys:
+            raise JwksError('no signing keys available')
+        return key
+
+    def _is_expired(self, now):
+        return self._fetched_at is None or now - self._fetched_at >= self.ttl
+
+    def _may_refresh(self, now):
+        return (
+            self._attempted_at is None
+            or now - self._attempted_at >= self.min_refresh_interval
+        )
+
+    def _refresh(self):
+        attempts = self._attempts
+        with self._lock:
+            # an other caller fetched while we were waiting, share its result
+            if self._attempts != attempts or not self._may_refresh(self.clock()):
+                return
+            self._attempts += 1
+            try:
+                keys = index_jwks(self.source.fetch())
+            except Exception:
+                # keep serving the stale keys, if any
+                return
+            finally:
+                # set once the fetch is over: callers arriving meanwhile
+                # still wait for it rather than failing without keys
+                self._attempted_at = self.clock()
+            self._keys = keys
+            self._fetched_at = self._attempted_at
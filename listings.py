@@ -0,0 +1,111 @@
+from dates import parse_release_date
+from models import db, Actor, Movie, Gender
+from serializers import actor_layout, movie_layout
+from pagination import Sort
+from endpoints_errors import filter_error, sort_error, fields_error
+
+'''
+filters values
+    query string value -> filtered value, raising filter_error(name, ...)
+'''
+def int_value(name, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise filter_error(name, 'an integer')
+
+def gender_value(name, value):
+    if value.lower() not in ('male', 'female'):
+        raise filter_error(name, '`male` or `female`')
+    return Gender[value.lower()]
+
+def prefix_value(name, value):
+    if not value:
+        raise filter_error(name, 'a non empty string')
+    return value
+
+def instant_value(name, value):
+    # the release dates sent in payloads, UTC when no offset is given
+    instant = parse_release_date(value)
+    if instant is None:
+        raise filter_error(name, 'an ISO 8601 date or datetime (`2020-05-03`, `2020-05-03T23:00+01:00`)')
+    return instant
+
+'''
+listings parameters
+    filters: name -> (value parser, condition builder), all the filters
+    sent are combined, each is backed by an index (see models)
+    sort: the sortable fields
+'''
+listing_filters = {
+    'actors': {
+        'gender': (gender_value, lambda value: Actor.gender == value),
+        'min_age': (int_value, lambda value: Actor.age >= value),
+        'max_age': (int_value, lambda value: Actor.age <= value),
+        'name_prefix': (prefix_value, lambda value: Actor.name.startswith(value, autoescape=True)),
+    },
+    'movies': {
+        'released_after': (instant_value, lambda value: Movie.release_date >= value),
+        'released_before': (instant_value, lambda value: Movie.release_date < value),
+        'title_prefix': (prefix_value, lambda value: Movie.title.startswith(value, autoescape=True)),
+    },
+}
+
+listing_sorts = {
+    'actors': {'id': Actor.id, 'name': Actor.name, 'age': Actor.age},
+    'movies': {'id': Movie.id, 'title': Movie.title, 'release_date': Movie.release_date},
+}
+
+listing_layouts = {'actors': actor_layout, 'movies': movie_layout}
+
+def sort_args(table, args):
+    sort = args.get('sort')
+    if sort is None:
+        return None
+    descending = sort.startswith('-')
+    if descending:
+        sort = sort[1:]
+    column = listing_sorts[table].get(sort)
+    if column is None:
+        raise sort_error(listing_sorts[table])
+    if sort == 'id' and not descending:
+        return None
+    return Sort(column, descending)
+
+def fields_args(table, args):
+    layout = listing_layouts[table]
+    fields = args.get('fields')
+    if fields is None:
+        return layout.names
+    fields = set(fields.split(','))
+    if not fields <= set(layout.names):
+        raise fields_error(layout.names)
+    return layout.projection(fields)
+
+'''
+listing_conditions(table, args)
+    the conditions of the `table` filters sent in the query string `args`
+'''
+def listing_conditions(table, args):
+    conditions = []
+    for name, (parse, condition) in listing_filters[table].items():
+        value = args.get(name)
+        if value is not None:
+            conditions.append(condition(parse(name, value)))
+    return conditions
+
+'''
+listing_query(table, args)
+    the query of the `table` listing asked by the request query string
+    `args`: its filters, its sort and its fields (`fields=id,name`), only
+    the asked fields columns are read, and associations only when asked
+    returns (query, fields, sort), the sort column is selected last as `sort_key`
+'''
+def listing_query(table, args):
+    conditions = listing_conditions(table, args)
+    sort = sort_args(table, args)
+    fields = fields_args(table, args)
+    columns = listing_layouts[table].columns(fields)
+    if sort is not None:
+        columns.append(sort.column.label('sort_key'))
+    return db.session.query(*columns).filter(*conditions), fields, sort
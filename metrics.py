@@ -0,0 +1,142 @@
+import bisect
+import os
+import threading
+
+# Bearer token /metrics requires when set
+metrics_token = os.environ.get('METRICS_TOKEN')
+# without a token /metrics is not found, unless served openly on purpose
+metrics_public = os.environ.get('METRICS_PUBLIC', 'false').lower() == 'true'
+
+'''
+Counter
+    monotonic count, inc(amount=1)
+'''
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, '', self.value
+
+'''
+Gauge
+    value read from `function` when the metrics are collected
+'''
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help, function):
+        self.name = name
+        self.help = help
+        self.function = function
+
+    def samples(self):
+        yield self.name, '', self.function()
+
+'''
+Histogram
+    distribution of observed values (seconds) over cumulative `buckets`,
+    with their count and sum
+'''
+class Histogram:
+    kind = 'histogram'
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, help, buckets=default_buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, labels=''):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulated = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulated += count
+            yield self.name + '_bucket', '{%sle="%s"}' % (labels + ',' if labels else '', bound), cumulated
+        labels = '{%s}' % labels if labels else ''
+        yield self.name + '_count', labels, cumulated
+        yield self.name + '_sum', labels, total
+
+'''
+HistogramFamily
+    one Histogram per combination of `label_names` values,
+    labels(*values) returns (creating it the first time) the one of `values`
+'''
+class HistogramFamily:
+    kind = 'histogram'
+
+    def __init__(self, name, help, label_names, buckets=Histogram.default_buckets):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, Histogram(self.name, self.help, self.buckets))
+        return child
+
+    def samples(self):
+        for values, child in sorted(self.children.items()):
+            labels = ','.join(
+                '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                for name, value in zip(self.label_names, values)
+            )
+            yield from child.samples(labels)
+
+'''
+Registry
+    the metrics of the process, rendered in the Prometheus text format
+'''
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self.register(Counter(name, help))
+
+    def gauge(self, name, help, function):
+        return self.register(Gauge(name, help, function))
+
+    def histogram(self, name, help, buckets=Histogram.default_buckets, label_names=None):
+        if label_names:
+            return self.register(HistogramFamily(name, help, label_names, buckets))
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('%s%s %s' % (name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
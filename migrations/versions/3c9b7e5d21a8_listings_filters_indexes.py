@@ -0,0 +1,34 @@
+"""listings filters indexes
+
+Revision ID: 3c9b7e5d21a8
+Revises: 8a41f0c6d2b7
+Create Date: 2026-10-18 11:12:40.318562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9b7e5d21a8'
+down_revision = '8a41f0c6d2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_actors_age_id', 'actors', ['age', 'id'])
+    op.create_index('ix_actors_gender_id', 'actors', ['gender', 'id'])
+    op.create_index('ix_actors_name_pattern', 'actors', ['name'],
+        postgresql_ops={'name': 'text_pattern_ops'})
+    op.create_index('ix_movies_release_date_id', 'movies', ['release_date', 'id'])
+    op.create_index('ix_movies_title_pattern', 'movies', ['title'],
+        postgresql_ops={'title': 'text_pattern_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_movies_title_pattern', table_name='movies')
+    op.drop_index('ix_movies_release_date_id', table_name='movies')
+    op.drop_index('ix_actors_name_pattern', table_name='actors')
+    op.drop_index('ix_actors_gender_id', table_name='actors')
+    op.drop_index('ix_actors_age_id', table_name='actors')
@@ -0,0 +1,35 @@
+"""actors movies indexes
+
+Revision ID: 5c7e2d1a9f43
+Revises: 04b281a110fc
+Create Date: 2026-10-18 09:12:40.418202
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c7e2d1a9f43'
+down_revision = '04b281a110fc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keep the first of each duplicated assignment, the unique index refuses them
+    op.execute(
+        'DELETE FROM actors_movies duplicate USING actors_movies kept '
+        'WHERE duplicate.actor_id = kept.actor_id '
+        'AND duplicate.movie_id = kept.movie_id '
+        'AND duplicate.id > kept.id'
+    )
+    # actor -> movies lookups, and uniqueness of the pair
+    op.create_index('ix_actors_movies_actor_id_movie_id', 'actors_movies', ['actor_id', 'movie_id'], unique=True)
+    # movie -> actors lookups and movies cascade deletes
+    op.create_index('ix_actors_movies_movie_id_actor_id', 'actors_movies', ['movie_id', 'actor_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_actors_movies_movie_id_actor_id', table_name='actors_movies')
+    op.drop_index('ix_actors_movies_actor_id_movie_id', table_name='actors_movies')
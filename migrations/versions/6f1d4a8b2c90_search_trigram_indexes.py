@@ -0,0 +1,29 @@
+"""search trigram indexes
+
+Revision ID: 6f1d4a8b2c90
+Revises: 3c9b7e5d21a8
+Create Date: 2026-10-18 12:05:17.902431
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f1d4a8b2c90'
+down_revision = '3c9b7e5d21a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_actors_name_trgm', 'actors', ['name'],
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_movies_title_trgm', 'movies', ['title'],
+        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_movies_title_trgm', table_name='movies')
+    op.drop_index('ix_actors_name_trgm', table_name='actors')
@@ -0,0 +1,33 @@
+"""table versions
+
+Revision ID: 8a41f0c6d2b7
+Revises: 5c7e2d1a9f43
+Create Date: 2026-10-18 10:03:52.771094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41f0c6d2b7'
+down_revision = '5c7e2d1a9f43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_versions = op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [
+        {'name': 'actors', 'version': 0},
+        {'name': 'movies', 'version': 0},
+        {'name': 'actors_movies', 'version': 0}
+    ])
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,31 @@
+"""actors movies on delete cascade
+
+Revision ID: 9d3a6c1e7b52
+Revises: 6f1d4a8b2c90
+Create Date: 2026-10-18 14:21:07.318455
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3a6c1e7b52'
+down_revision = '6f1d4a8b2c90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # deleting an actor or a movie deletes its assignments in the same statement
+    op.drop_constraint('actors_movies_actor_id_fkey', 'actors_movies', type_='foreignkey')
+    op.drop_constraint('actors_movies_movie_id_fkey', 'actors_movies', type_='foreignkey')
+    op.create_foreign_key('actors_movies_actor_id_fkey', 'actors_movies', 'actors', ['actor_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('actors_movies_movie_id_fkey', 'actors_movies', 'movies', ['movie_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('actors_movies_movie_id_fkey', 'actors_movies', type_='foreignkey')
+    op.drop_constraint('actors_movies_actor_id_fkey', 'actors_movies', type_='foreignkey')
+    op.create_foreign_key('actors_movies_movie_id_fkey', 'actors_movies', 'movies', ['movie_id'], ['id'])
+    op.create_foreign_key('actors_movies_actor_id_fkey', 'actors_movies', 'actors', ['actor_id'], ['id'])
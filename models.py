@@ -1,9 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
 from enum import Enum
-from flask_migrate import Migrate
+from sqlalchemy import any_, bindparam, event
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import ARRAY
+from cache import LRUCache
+from pool import engine_options
+from dates import format_release_date
+from itertools import chain
+from datetime import timezone
 import os
-
-database_uri = os.environ['DATABASE_URL']
+import sqlite3
+import time
 
 db = SQLAlchemy()
 
@@ -13,6 +21,15 @@ movie_title_length = int(os.environ.get('MOVIE_TITLE_LENGTH', 120))
 # actor name max length
 actor_name_length = int(os.environ.get('ACTOR_NAME_MAX_LENGTH', 60))
 
+# values per IN (...) clause, keeps every backend under its bind parameters limit
+in_clause_size = 500
+
+# seconds an id found in the database is trusted without checking it again
+id_cache_ttl = int(os.environ.get('ID_CACHE_TTL', 60))
+
+# (table name, id) of recently seen rows, ids of deleted rows are dropped
+known_ids = LRUCache(maxsize=int(os.environ.get('ID_CACHE_SIZE', 10000)))
+
 '''
 ActionError Exception
 A standardized way to communicate data integrity errors
@@ -26,24 +43,291 @@ class ActionError(Exception):
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
-def setup_db(app, database_uri=database_uri):
+def setup_db(app, database_uri=None):
+    if database_uri is None:
+        # read when an app is set up, not at import: importing the models
+        # (tools, tests, preloading servers) needs no database
+        database_uri = os.environ['DATABASE_URL']
     app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # pool sizing, pre-ping, recycle and statement timeout (see pool.py)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(database_uri))
     db.app = app
+    # migrations tooling (Flask-Migrate, Alembic) is only loaded by manage.py
     db.init_app(app)
-    migrate = Migrate(app, db)
+
+# actors_movies rows are removed by their foreign keys ON DELETE CASCADE,
+# which SQLite only enforces once asked to, per connection
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+def chunks(values, size=in_clause_size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+'''
+insert_values(table, rows)
+    inserts `rows` (dicts with the same keys) with one multi-row
+    INSERT ... VALUES statement per in_clause_size rows, an executemany
+    would be sent by psycopg2 as one INSERT, and round trip, per row
+'''
+def insert_values(table, rows):
+    for chunk in chunks(rows):
+        db.session.execute(table.insert().values(chunk))
+
+def is_postgresql():
+    return db.engine.dialect.name == 'postgresql'
+
+'''
+ids_filter(column, ids)
+    `column = ANY(:ids)` on postgres, a single bind parameter whatever the
+    number of ids, `column IN (...)` elsewhere
+'''
+def ids_filter(column, ids):
+    if is_postgresql():
+        return column == any_(bindparam('ids', list(ids), type_=ARRAY(db.Integer), unique=True))
+    return column.in_(list(ids))
+
+'''
+find_missing_ids(model, ids)
+    returns the ids of `ids` having no row in `model` table
+    ids not recently seen are checked all at once, with a single query
+    on postgres (IN (...) chunks elsewhere)
+'''
+def find_missing_ids(model, ids):
+    table = model.__tablename__
+    unknown = [id for id in set(ids) if known_ids.get((table, id)) is None]
+    if not unknown:
+        return set()
+    batches = [unknown] if is_postgresql() else chunks(unknown)
+    found = set()
+    for batch in batches:
+        found.update(id for id, in db.session.query(model.id).filter(ids_filter(model.id, batch)))
+    expires_at = time.time() + id_cache_ttl
+    for id in found:
+        known_ids.set((table, id), True, expires_at=expires_at)
+    return set(unknown) - found
+
+'''
+writes
+    the models insert(), update() and delete() only flush their
+    statements, the transaction is committed once per request (see
+    transactions.py), scripts writing outside of a request commit it
+'''
+
+'''
+changes tracking
+    the rows written by a transaction are collected in session.info as a
+    {table name: set of ids} mapping, ids None meaning any row of the table
+    functions registered with on_committed_changes(listener) are called
+    with that mapping once the transaction is committed, nothing is sent
+    for rolled back transactions
+    ORM writes are recorded at flush time, core statements must be
+    recorded with mark_changed(table, ids)
+'''
+change_listeners = []
+
+def on_committed_changes(listener):
+    change_listeners.append(listener)
+    return listener
+
+def mark_changed(table, ids=None, session=None):
+    changes = (session or db.session).info.setdefault('changes', {})
+    if ids is None:
+        changes[table] = None
+    elif changes.get(table, ()) is not None:
+        changes.setdefault(table, set()).update(ids)
+
+@on_committed_changes
+def evict_known_ids(changes):
+    # evicted once the writes are committed: evicted earlier, a concurrent
+    # find_missing_ids could cache a row being deleted as existing again,
+    # and a rolled back delete would evict its rows for nothing
+    for table in ('actors', 'movies'):
+        if table not in changes:
+            continue
+        if changes[table] is None:
+            known_ids.clear()
+            return
+        for id in changes[table]:
+            known_ids.delete((table, id))
+
+@event.listens_for(db.session, 'after_flush')
+def record_flushed_changes(session, flush_context):
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Assigning_actors_movies):
+            # assignments are part of both the actor and the movie
+            mark_changed('actors_movies', [instance.id], session)
+            mark_changed('actors', [instance.actor_id], session)
+            mark_changed('movies', [instance.movie_id], session)
+        elif isinstance(instance, (Actor, Movie)):
+            mark_changed(instance.__tablename__, [instance.id], session)
+
+'''
+table versions
+    a counter per table, incremented in the same transaction as any
+    write to the table, shared by all the workers through the database
+    it lets payloads be tagged (ETag) and cached without reading their rows
+'''
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+def table_versions(*tables):
+    versions = dict.fromkeys(tables, 0)
+    versions.update(
+        db.session.query(TableVersion.name, TableVersion.version)
+        .filter(TableVersion.name.in_(tables))
+    )
+    return versions
+
+def bump_table_versions(session, tables):
+    table = TableVersion.__table__
+    for name in sorted(tables):
+        updated = session.execute(
+            table.update()
+            .where(table.c.name == name)
+            .values(version=table.c.version + 1)
+        )
+        if updated.rowcount == 0:
+            session.execute(table.insert().values(name=name, version=1))
+
+@event.listens_for(db.session, 'before_commit')
+def bump_changed_versions(session):
+    # pending ORM writes have to be recorded before the versions are bumped
+    session.flush()
+    changes = session.info.get('changes')
+    if changes:
+        bump_table_versions(session, changes)
+
+@event.listens_for(db.session, 'after_commit')
+def notify_committed_changes(session):
+    changes = session.info.pop('changes', None)
+    if changes:
+        for listener in change_listeners:
+            listener(changes)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_changes(session):
+    session.info.pop('changes', None)
+
+# actors_movies foreign key -> referenced table
+assigned_tables = {'actor_id': 'actors', 'movie_id': 'movies'}
+
+'''
+sync_assignments(owner_column, owner_id, linked_column, linked_ids)
+    makes the actors_movies rows of an actor (or movie) match `linked_ids`
+    only the added pairs are inserted and only the removed ones deleted,
+    each with a single statement, the order of `linked_ids` is irrelevant
+    returns True if any row changed
+'''
+def sync_assignments(owner_column, owner_id, linked_column, linked_ids):
+    table = Assigning_actors_movies.__table__
+    current = {
+        id for id, in db.session.query(linked_column).filter(owner_column == owner_id)
+    }
+    wanted = set(linked_ids)
+    added = wanted - current
+    removed = current - wanted
+    if removed:
+        db.session.execute(
+            table.delete()
+            .where(owner_column == owner_id)
+            .where(ids_filter(linked_column, removed))
+        )
+    if added:
+        insert_values(table, [
+            {owner_column.key: owner_id, linked_column.key: id} for id in added
+        ])
+    if added or removed:
+        mark_changed('actors_movies')
+        mark_changed(assigned_tables[owner_column.key], [owner_id])
+        mark_changed(assigned_tables[linked_column.key], added | removed)
+    return bool(added or removed)
+
+'''
+mark_cascaded_changes(model, ids)
+    records the changes the database ON DELETE CASCADE makes when the
+    `model` rows of `ids` are deleted: their actors_movies rows, and the
+    linked rows whose cached payloads list the deleted ones
+    must run before the delete, only the linked ids are read
+'''
+def mark_cascaded_changes(model, ids):
+    table = Assigning_actors_movies.__table__
+    owner_column, linked_column = (
+        (table.c.actor_id, table.c.movie_id) if model is Actor
+        else (table.c.movie_id, table.c.actor_id)
+    )
+    linked = {
+        id for id, in db.session.query(linked_column).filter(ids_filter(owner_column, ids))
+    }
+    if linked:
+        mark_changed('actors_movies')
+        mark_changed(assigned_tables[linked_column.key], linked)
+
+'''
+delete_entities(model, ids)
+    deletes the `model` rows of `ids` with a single statement, without
+    loading them, their actors_movies rows are deleted by the database
+    (ON DELETE CASCADE)
+    returns the number of deleted `model` rows
+'''
+def delete_entities(model, ids):
+    ids = list(ids)
+    mark_cascaded_changes(model, ids)
+    deleted = db.session.execute(
+        model.__table__.delete().where(ids_filter(model.__table__.c.id, ids))
+    ).rowcount
+    if deleted:
+        mark_changed(model.__tablename__, ids)
+    return deleted
+
+'''
+UTCDateTime
+    timezone aware DateTime column, on databases without timezone support
+    (SQLite drops the offset and keeps the wall time) values are stored
+    converted to UTC, and read back as UTC datetimes
+'''
+class UTCDateTime(TypeDecorator):
+    impl = db.DateTime(timezone=True)
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql' or value.tzinfo is None:
+            return value
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def process_result_value(self, value, dialect):
+        if value is None or value.tzinfo is not None:
+            return value
+        return value.replace(tzinfo=timezone.utc)
 
 # Movie
 class Movie(db.Model):
     __tablename__ = 'movies'
+    __table_args__ = (
+        # listings filters and sorts, id breaks the ties of keyset pages
+        db.Index('ix_movies_release_date_id', 'release_date', 'id'),
+        # title prefix (LIKE 'prefix%') whatever the database collation
+        db.Index('ix_movies_title_pattern', 'title', postgresql_ops={'title': 'text_pattern_ops'}),
+        # search (pg_trgm similarity and ILIKE '%query%')
+        db.Index('ix_movies_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(movie_title_length), unique=True, nullable=False)
-    release_date = db.Column(db.DateTime(timezone=True), nullable=False)
+    release_date = db.Column(UTCDateTime, nullable=False)
     actors = db.relationship(
         'Assigning_actors_movies',
         backref='movies',
         lazy=True,
-        cascade='save-update, delete'
+        cascade='save-update, delete',
+        # the assignments are deleted by the database, not loaded to be deleted
+        passive_deletes=True
     )
 
     def __init__(self, title=None, release_date=None, actors=[]):
@@ -53,31 +337,45 @@ class Movie(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
 
     def update(self):
-        db.session.commit()
+        db.session.flush()
 
     def delete(self):
+        # the assignments are deleted by the database, unseen by the flush
+        mark_cascaded_changes(type(self), [self.id])
         db.session.delete(self)
-        db.session.commit()
+        db.session.flush()
+
+    def set_actors(self, actors_ids):
+        changed = sync_assignments(
+            Assigning_actors_movies.movie_id, self.id,
+            Assigning_actors_movies.actor_id, actors_ids
+        )
+        if changed:
+            db.session.expire(self, ['actors'])
+        return changed
 
     def format(self):
-        formatted_time = self.release_date.strftime('%d/%m/%Y %H:%M UTC%z')
         actors = [actor.actor_id for actor in self.actors]
         return {
             "id": self.id,
             "title": self.title,
-            "release_date": formatted_time[0:-2],
+            "release_date": format_release_date(self.release_date),
             "actors": actors
         }    
 
 #assigning actors and movies
 class Assigning_actors_movies(db.Model):
     __tablename__ = 'actors_movies'
+    __table_args__ = (
+        db.Index('ix_actors_movies_actor_id_movie_id', 'actor_id', 'movie_id', unique=True),
+        db.Index('ix_actors_movies_movie_id_actor_id', 'movie_id', 'actor_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    actor_id = db.Column(db.Integer, db.ForeignKey('actors.id'), nullable=False)
-    movie_id = db.Column(db.Integer, db.ForeignKey('movies.id'), nullable=False)
+    actor_id = db.Column(db.Integer, db.ForeignKey('actors.id', ondelete='CASCADE'), nullable=False)
+    movie_id = db.Column(db.Integer, db.ForeignKey('movies.id', ondelete='CASCADE'), nullable=False)
 
     def __init__(self, actor_id=None, movie_id=None):
         self.movie_id = movie_id
@@ -85,14 +383,14 @@ class Assigning_actors_movies(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
 
     def update(self):
-        db.session.commit()
+        db.session.flush()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        db.session.flush()
 
 # Actor
 class Gender(Enum):
@@ -101,6 +399,15 @@ class Gender(Enum):
 
 class Actor(db.Model):
     __tablename__ = 'actors'
+    __table_args__ = (
+        # listings filters and sorts, id breaks the ties of keyset pages
+        db.Index('ix_actors_age_id', 'age', 'id'),
+        db.Index('ix_actors_gender_id', 'gender', 'id'),
+        # name prefix (LIKE 'prefix%') whatever the database collation
+        db.Index('ix_actors_name_pattern', 'name', postgresql_ops={'name': 'text_pattern_ops'}),
+        # search (pg_trgm similarity and ILIKE '%query%')
+        db.Index('ix_actors_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(actor_name_length), nullable=False, unique=True)
     age = db.Column(db.Integer, nullable=False)
@@ -109,7 +416,9 @@ class Actor(db.Model):
         'Assigning_actors_movies',
         backref='actors',
         lazy=True,
-        cascade='save-update, delete'
+        cascade='save-update, delete',
+        # the assignments are deleted by the database, not loaded to be deleted
+        passive_deletes=True
     )
 
     def __init__(self, name=None, age=None, gender=None, movies=[]):
@@ -120,14 +429,25 @@ class Actor(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
 
     def update(self):
-        db.session.commit()
+        db.session.flush()
 
     def delete(self):
+        # the assignments are deleted by the database, unseen by the flush
+        mark_cascaded_changes(type(self), [self.id])
         db.session.delete(self)
-        db.session.commit()
+        db.session.flush()
+
+    def set_movies(self, movies_ids):
+        changed = sync_assignments(
+            Assigning_actors_movies.actor_id, self.id,
+            Assigning_actors_movies.movie_id, movies_ids
+        )
+        if changed:
+            db.session.expire(self, ['movies'])
+        return changed
 
     def format(self):
         movies = [movie.movie_id for movie in self.movies]
@@ -140,3 +460,9 @@ class Actor(db.Model):
         }   
 
 
+
+# the trigram indexes operator classes come with the pg_trgm extension
+event.listen(
+    db.metadata, 'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
@@ -0,0 +1,164 @@
+import base64
+import json
+import os
+from datetime import datetime
+from sqlalchemy import tuple_
+from flask import Response, stream_with_context
+from endpoints_errors import max_page_size, page_limit_error, page_cursor_error
+from endpoints_errors import stream_format_error
+from serializers import dumps
+
+# page size used when `after` is sent without `limit`
+default_page_size = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+
+# rows fetched per round trip from the server side cursor while streaming
+stream_batch_size = int(os.environ.get('STREAM_BATCH_SIZE', 500))
+
+'''
+encode_cursor(values) / decode_cursor(cursor)
+    opaque keyset cursors, the values of the last row sort key
+    serialized as url safe base64 json
+'''
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise page_cursor_error
+    if type(values) != list or len(values) == 0:
+        raise page_cursor_error
+    return values
+
+'''
+page_args(args)
+    reads `limit` and `after` from the request query string
+    returns (None, None) when the client did not ask for a page
+'''
+def page_args(args):
+    limit = args.get('limit')
+    after = args.get('after')
+    if limit is None and after is None:
+        return None, None
+    if limit is None:
+        limit = default_page_size
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise page_limit_error
+        if limit < 1 or limit > max_page_size:
+            raise page_limit_error
+    if after is not None:
+        after = decode_cursor(after)
+    return limit, after
+
+'''
+Sort(column, descending=False)
+    listing order on `column`, rows sharing a value are ordered by id
+    its keyset cursors are [value, id], datetimes sent in ISO 8601
+'''
+class Sort:
+    def __init__(self, column, descending=False):
+        self.column = column
+        self.descending = descending
+
+    def order_by(self, id_column):
+        if self.descending:
+            return self.column.desc(), id_column.desc()
+        return self.column, id_column
+
+    def encode(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    def decode(self, value):
+        python_type = self.column.type.python_type
+        if python_type is datetime and type(value) == str:
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                raise page_cursor_error
+        if type(value) != python_type:
+            raise page_cursor_error
+        return value
+
+'''
+ordered(query, id_column, sort)
+    `query` in the listing order, by id when `sort` is None
+'''
+def ordered(query, id_column, sort):
+    if sort is None:
+        return query.order_by(id_column)
+    return query.order_by(*sort.order_by(id_column))
+
+'''
+keyset_page(query, id_column, limit, after, sort=None)
+    fetches the `limit` rows following the cursor `after`, ordered by
+    `sort` then `id_column`, by `id_column` alone when `sort` is None
+    when sorting, `query` must select the sort column last, labelled `sort_key`
+    one more row is read to know whether a next page exists
+    returns the rows and the next page cursor, None on the last page
+'''
+def keyset_page(query, id_column, limit, after, sort=None):
+    if after is not None:
+        if sort is None:
+            if len(after) != 1 or type(after[0]) != int:
+                raise page_cursor_error
+            query = query.filter(id_column > after[0])
+        else:
+            if len(after) != 2 or type(after[1]) != int:
+                raise page_cursor_error
+            key = tuple_(sort.column, id_column)
+            bound = tuple_(sort.decode(after[0]), after[1])
+            query = query.filter(key < bound if sort.descending else key > bound)
+    rows = ordered(query, id_column, sort).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    if sort is None:
+        return rows, encode_cursor([rows[-1].id])
+    return rows, encode_cursor([sort.encode(rows[-1].sort_key), rows[-1].id])
+
+'''
+stream_response(key, query, format_rows, stream_format)
+    streams every row of `query` without holding them all in memory,
+    rows are read in batches through a server side cursor and each batch
+    is formatted at once by format_rows(rows)
+    stream_format `ndjson`: one json document per line
+    stream_format `json`: the usual {"success": true, key: [...]} payload, sent in chunks
+'''
+def stream_response(key, query, format_rows, stream_format):
+    if stream_format not in ('ndjson', 'json'):
+        raise stream_format_error
+    rows = query.execution_options(stream_results=True).yield_per(stream_batch_size)
+
+    def batches():
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == stream_batch_size:
+                yield [dumps(item) for item in format_rows(batch)]
+                batch = []
+        if batch:
+            yield [dumps(item) for item in format_rows(batch)]
+
+    def ndjson():
+        for batch in batches():
+            yield b'\n'.join(batch) + b'\n'
+
+    def json_array():
+        yield ('{"success":true,"%s":[' % key).encode()
+        separator = b''
+        for batch in batches():
+            yield separator + b','.join(batch)
+            separator = b','
+        yield b']}'
+
+    if stream_format == 'ndjson':
+        return Response(stream_with_context(ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(json_array()), mimetype='application/json')
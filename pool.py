@@ -0,0 +1,111 @@
+import os
+import time
+import weakref
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+from metrics import registry
+
+'''
+connection pool settings
+    every worker process has its own pool: by default it holds one
+    connection per worker thread, and when DB_MAX_CONNECTIONS (the
+    connections the database accepts from the whole application) is set,
+    the pool and its overflow are capped to that budget shared by the
+    WEB_CONCURRENCY workers
+'''
+web_concurrency = int(os.environ.get('WEB_CONCURRENCY', 1))
+web_threads = int(os.environ.get('WEB_THREADS', 1))
+db_max_connections = int(os.environ.get('DB_MAX_CONNECTIONS', 0))
+db_pool_size = int(os.environ.get('DB_POOL_SIZE', web_threads))
+db_max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+# seconds a request waits for a connection before failing
+db_pool_timeout = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+# seconds after which a connection is replaced, under the server and proxies idle timeouts
+db_pool_recycle = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# milliseconds a statement may run on postgres, 0 for no limit
+db_statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+
+checkout_wait = registry.histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled connection, connecting included')
+checkout_timeouts = registry.counter(
+    'db_pool_checkout_timeouts_total',
+    'Checkouts that failed after waiting DB_POOL_TIMEOUT seconds')
+connections_opened = registry.counter(
+    'db_pool_connections_opened_total', 'Database connections opened')
+connections_closed = registry.counter(
+    'db_pool_connections_closed_total', 'Database connections closed')
+connections_invalidated = registry.counter(
+    'db_pool_connections_invalidated_total', 'Database connections invalidated (disconnects, failed pre-pings)')
+
+def worker_pool_size():
+    pool_size, max_overflow = db_pool_size, db_max_overflow
+    if db_max_connections:
+        budget = max(1, db_max_connections // web_concurrency)
+        pool_size = min(pool_size, budget)
+        max_overflow = min(max_overflow, budget - pool_size)
+    return pool_size, max_overflow
+
+'''
+InstrumentedQueuePool
+    QueuePool timing every checkout wait and counting the timeouts,
+    live pools are tracked for the pool gauges
+'''
+class InstrumentedQueuePool(QueuePool):
+    pools = weakref.WeakSet()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        InstrumentedQueuePool.pools.add(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            checkout_timeouts.inc()
+            raise
+        finally:
+            checkout_wait.observe(time.perf_counter() - start)
+
+    def capacity(self):
+        return self.size() + self._max_overflow
+
+# listened on the class, recreated pools (engine.dispose()) would otherwise count twice
+event.listen(InstrumentedQueuePool, 'connect', lambda *args: connections_opened.inc())
+event.listen(InstrumentedQueuePool, 'close', lambda *args: connections_closed.inc())
+event.listen(InstrumentedQueuePool, 'close_detached', lambda *args: connections_closed.inc())
+event.listen(InstrumentedQueuePool, 'invalidate', lambda *args: connections_invalidated.inc())
+
+def pools_total(measure):
+    return sum(measure(pool) for pool in list(InstrumentedQueuePool.pools))
+
+registry.gauge('db_pool_size', 'Connections the pools keep open',
+    lambda: pools_total(InstrumentedQueuePool.size))
+registry.gauge('db_pool_checked_out', 'Connections currently in use',
+    lambda: pools_total(InstrumentedQueuePool.checkedout))
+registry.gauge('db_pool_overflow', 'Connections opened beyond the pool size',
+    lambda: pools_total(lambda pool: max(pool.overflow(), 0)))
+registry.gauge('db_pool_saturation', 'Connections in use over the pools capacity (1 means requests wait)',
+    lambda: pools_total(InstrumentedQueuePool.checkedout) / max(pools_total(InstrumentedQueuePool.capacity), 1))
+
+'''
+engine_options(database_uri)
+    SQLALCHEMY_ENGINE_OPTIONS of the database: pre-ping and recycle
+    always, the sized instrumented pool and the statement timeout for
+    server databases (SQLite keeps the pool Flask-SQLAlchemy picks)
+'''
+def engine_options(database_uri):
+    options = {'pool_pre_ping': True, 'pool_recycle': db_pool_recycle}
+    if database_uri.startswith('sqlite'):
+        return options
+    pool_size, max_overflow = worker_pool_size()
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=db_pool_timeout,
+    )
+    if database_uri.startswith('postgres') and db_statement_timeout:
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % db_statement_timeout}
+    return options
@@ -0,0 +1,171 @@
+import os
+import re
+import threading
+from sqlalchemy import func, literal, select, desc, union_all, or_, text
+from models import db, Actor, Movie, is_postgresql, table_versions
+from endpoints_errors import search_query_error, search_window_error, search_type_error
+from endpoints_errors import max_search_query_length, max_search_window
+
+# results per page when `limit` is not sent
+default_search_limit = int(os.environ.get('DEFAULT_SEARCH_LIMIT', 10))
+
+# minimum trigram similarity of a result not containing the query, set as
+# pg_trgm.similarity_threshold for the search transaction on postgres
+similarity_threshold = float(os.environ.get('SEARCH_SIMILARITY_THRESHOLD', 0.3))
+
+# searched table -> (result type, model, searched column, result field)
+search_tables = {
+    'actors': ('actor', Actor, Actor.name, 'name'),
+    'movies': ('movie', Movie, Movie.title, 'title'),
+}
+
+'''
+trigrams(value)
+    the pg_trgm trigrams of `value`: lower cased alphanumeric words, each
+    padded with two spaces before and one after
+'''
+def trigrams(value):
+    grams = set()
+    for word in re.findall(r'\w+', value.lower()):
+        word = '  %s ' % word
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+def similarity(query_grams, grams):
+    if not query_grams or not grams:
+        return 0.0
+    common = len(query_grams & grams)
+    return common / (len(query_grams) + len(grams) - common)
+
+# ILIKE escape character, not a backslash whose quoting depends on the server settings
+like_escape = '!'
+
+def like_pattern(query):
+    escaped = query.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    return '%' + escaped + '%'
+
+'''
+TrigramIndex
+    in-process inverted index trigram -> ids, the search backend of the
+    databases without pg_trgm (SQLite tests)
+    matches as postgres does: texts containing the query (ILIKE) or at
+    least `similarity_threshold` similar to it, ranked by similarity
+'''
+class TrigramIndex:
+    def __init__(self, rows):
+        self.texts = {}
+        self.grams = {}
+        self.postings = {}
+        for id, value in rows:
+            grams = trigrams(value)
+            self.texts[id] = value
+            self.grams[id] = grams
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(id)
+
+    def search(self, query):
+        query_grams = trigrams(query)
+        lowered = query.lower()
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(self.postings.get(gram, ()))
+        if len(lowered) < 3 or not query_grams:
+            # too short for trigrams, substring scan as ILIKE would
+            candidates = self.texts.keys()
+        results = []
+        for id in candidates:
+            score = similarity(query_grams, self.grams[id])
+            if score >= similarity_threshold or lowered in self.texts[id].lower():
+                results.append((score, id, self.texts[id]))
+        return results
+
+# table -> (table version, TrigramIndex), rebuilt once the table version changed
+fallback_indexes = {}
+fallback_lock = threading.Lock()
+
+def fallback_index(table, version):
+    indexed = fallback_indexes.get(table)
+    if indexed is not None and indexed[0] == version:
+        return indexed[1]
+    with fallback_lock:
+        indexed = fallback_indexes.get(table)
+        if indexed is None or indexed[0] != version:
+            result_type, model, column, field = search_tables[table]
+            indexed = (version, TrigramIndex(db.session.query(model.id, column)))
+            fallback_indexes[table] = indexed
+    return indexed[1]
+
+def fallback_search(query, tables, size):
+    versions = table_versions(*tables)
+    results = []
+    for table in tables:
+        result_type = search_tables[table][0]
+        results.extend(
+            (score, result_type, id, value)
+            for score, id, value in fallback_index(table, versions[table]).search(query)
+        )
+    results.sort(key=lambda result: (-result[0], result[1], result[2]))
+    return results[:size]
+
+def postgresql_search(query, tables, size):
+    # the `%` operator compares to the setting, is_local: reset with the transaction
+    db.session.execute(
+        text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+        {'threshold': str(similarity_threshold)}
+    )
+    selects = []
+    for table in tables:
+        result_type, model, column, field = search_tables[table]
+        score = func.similarity(column, query)
+        selects.append(
+            select([score.label('score'), literal(result_type).label('type'), model.id, column.label('text')])
+            # `%%` is pg_trgm `%` operator escaped for psycopg2, both use the trigram GIN index
+            .where(or_(column.ilike(like_pattern(query), escape=like_escape), column.op('%%')(query)))
+        )
+    statement = union_all(*selects)
+    statement = statement.order_by(desc('score'), 'type', 'id').limit(size)
+    return [tuple(row) for row in db.session.execute(statement)]
+
+'''
+search_args(args, granted)
+    reads `q`, `type`, `limit` and `offset` from the request query string
+    only the tables the token may read are searched
+    returns (query, tables, limit, offset)
+'''
+def search_args(args, granted):
+    query = args.get('q', '').strip()
+    if not query or len(query) > max_search_query_length:
+        raise search_query_error
+    readable = [table for table in search_tables if 'get:%s' % table in granted]
+    search_type = args.get('type')
+    if search_type is None:
+        tables = readable
+    elif search_type in search_tables:
+        tables = [search_type]
+        if search_type not in readable:
+            raise search_type_error
+    else:
+        raise search_type_error
+    try:
+        limit = int(args.get('limit', default_search_limit))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise search_window_error
+    if limit < 1 or offset < 0 or offset + limit > max_search_window:
+        raise search_window_error
+    return query, tables, limit, offset
+
+'''
+search(query, tables, limit, offset)
+    the `limit` best matches of `query` among `tables` names (actors) and
+    titles (movies) following the `offset` first ones, best first
+    each result is {"type", "id", "name" or "title", "score"}
+'''
+def search(query, tables, limit, offset):
+    backend = postgresql_search if is_postgresql() else fallback_search
+    results = backend(query, tables, offset + limit)[offset:]
+    fields = {result_type: field for result_type, model, column, field in search_tables.values()}
+    return [
+        {'type': result_type, 'id': id, fields[result_type]: value, 'score': round(score, 4)}
+        for score, result_type, id, value in results
+    ]
@@ -0,0 +1,125 @@
+import json
+from flask import current_app
+from models import db, Actor, Movie, Assigning_actors_movies, Gender, ids_filter, in_clause_size
+from dates import format_release_date
+from timings import timed
+
+try:
+    # optional, several times faster than the standard library encoder
+    import orjson
+except ImportError:
+    orjson = None
+
+gender_names = {gender: gender.name for gender in Gender}
+
+'''
+dumps(payload)
+    compact JSON bytes, encoded with orjson when installed
+'''
+def dumps(payload):
+    with timed('serialization'):
+        if orjson is not None:
+            return orjson.dumps(payload)
+        return json.dumps(payload, separators=(',', ':')).encode()
+
+def json_response(payload, status=200):
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
+
+'''
+linked_ids(owner_column, linked_column, ids)
+    {owner id: [linked ids]} of the actors_movies rows of `ids`, in insertion order
+    large sets of ids are read by id range then filtered, instead of
+    sending thousands of values to the database
+'''
+def linked_ids(owner_column, linked_column, ids):
+    links = {id: [] for id in ids}
+    if not links:
+        return links
+    query = db.session.query(owner_column, linked_column)
+    if len(links) > in_clause_size:
+        query = query.filter(owner_column.between(min(links), max(links)))
+    else:
+        query = query.filter(ids_filter(owner_column, links))
+    for owner_id, linked_id in query.order_by(Assigning_actors_movies.id):
+        owner_links = links.get(owner_id)
+        if owner_links is not None:
+            owner_links.append(linked_id)
+    return links
+
+'''
+Layout(model, fields, link)
+    how rows of `model` are formatted: `fields` maps each formatted field
+    to its (column, converter or None), in output order, `link` is the
+    (field, owner column, linked column) of its actors_movies ids list
+    listings read the columns of the fields asked for as tuples, id first,
+    and the association ids of all the rows with a single query
+'''
+class Layout:
+    def __init__(self, model, fields, link):
+        self.model = model
+        self.fields = fields
+        self.link = link
+        self.names = tuple(fields) + (link[0],)
+
+    def projection(self, names):
+        # layout ordered, id always included
+        return tuple(name for name in self.names if name == 'id' or name in names)
+
+    def columns(self, names=None):
+        names = self.names if names is None else names
+        return [self.fields[name][0] for name in names if name in self.fields]
+
+    '''
+    format(rows, names=None)
+        the formatted dicts of rows of columns(names), extra trailing
+        columns (sort keys) are ignored
+    '''
+    def format(self, rows, names=None):
+        with timed('serialization'):
+            return self._format(rows, names)
+
+    def _format(self, rows, names):
+        names = self.names if names is None else names
+        keys = [name for name in names if name in self.fields]
+        converters = [
+            (index, self.fields[name][1])
+            for index, name in enumerate(keys)
+            if self.fields[name][1] is not None
+        ]
+        link, owner_column, linked_column = self.link
+        links = None
+        if link in names:
+            links = linked_ids(owner_column, linked_column, [row[0] for row in rows])
+        formatted = []
+        for row in rows:
+            if converters:
+                row = list(row)
+                for index, convert in converters:
+                    row[index] = convert(row[index])
+            entity = dict(zip(keys, row))
+            if links is not None:
+                entity[link] = links[row[0]]
+            formatted.append(entity)
+        return formatted
+
+actor_layout = Layout(Actor, {
+    'id': (Actor.id, None),
+    'name': (Actor.name, None),
+    'age': (Actor.age, None),
+    'gender': (Actor.gender, gender_names.__getitem__),
+}, ('movies', Assigning_actors_movies.actor_id, Assigning_actors_movies.movie_id))
+
+movie_layout = Layout(Movie, {
+    'id': (Movie.id, None),
+    'title': (Movie.title, None),
+    'release_date': (Movie.release_date, format_release_date),
+}, ('actors', Assigning_actors_movies.movie_id, Assigning_actors_movies.actor_id))
+
+'''
+actor_columns / movie_columns and format_actors(rows) / format_movies(rows)
+    the Actor.format() / Movie.format() dicts of full rows
+'''
+actor_columns = actor_layout.columns()
+movie_columns = movie_layout.columns()
+format_actors = actor_layout.format
+format_movies = movie_layout.format
@@ -0,0 +1,207 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import auth
+from cache import LRUCache
+from jwks import JwksCache, JwksError, FileJwksSource, StaticJwksSource
+
+jwks_document = {
+    'keys': [{
+        'kty': 'RSA',
+        'kid': 'key-1',
+        'use': 'sig',
+        'n': 'modulus',
+        'e': 'AQAB'
+    }]
+}
+
+class Counting_source(StaticJwksSource):
+    """Static jwks source counting its fetches, optionally failing or slow"""
+
+    def __init__(self, jwks, delay=0):
+        super().__init__(jwks)
+        self.fetches = 0
+        self.failing = False
+        self.delay = delay
+
+    def fetch(self):
+        self.fetches += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.failing:
+            raise OSError('issuer unreachable')
+        return self.jwks
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class Jwks_cache(unittest.TestCase):
+    """This class represents the offline tests of the JWKS cache"""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.source = Counting_source(jwks_document)
+        self.cache = JwksCache(self.source, ttl=600, min_refresh_interval=30, clock=self.clock)
+
+    def test_keys_are_cached_until_ttl(self):
+        self.assertEqual(self.cache.get_key('key-1')['n'], 'modulus')
+        self.clock.now = 599
+        self.cache.get_key('key-1')
+        self.assertEqual(self.source.fetches, 1)
+        self.clock.now = 600
+        self.cache.get_key('key-1')
+        self.assertEqual(self.source.fetches, 2)
+
+    def test_unknown_kid_forces_rate_limited_refresh(self):
+        self.cache.get_key('key-1')
+        self.clock.now = 40
+        self.assertIsNone(self.cache.get_key('forged'))
+        self.assertIsNone(self.cache.get_key('forged'))
+        self.assertEqual(self.source.fetches, 2)
+        self.clock.now = 80
+        self.source.jwks = {'keys': jwks_document['keys'] + [dict(jwks_document['keys'][0], kid='key-2')]}
+        self.assertEqual(self.cache.get_key('key-2')['kid'], 'key-2')
+        self.assertEqual(self.source.fetches, 3)
+
+    def test_stale_keys_served_when_issuer_unreachable(self):
+        self.cache.get_key('key-1')
+        self.source.failing = True
+        self.clock.now = 1000
+        self.assertEqual(self.cache.get_key('key-1')['kid'], 'key-1')
+
+    def test_error_without_any_key(self):
+        self.source.failing = True
+        with self.assertRaises(JwksError):
+            self.cache.get_key('key-1')
+
+    def test_unknown_kids_without_keys_while_issuer_unreachable(self):
+        self.source.failing = True
+        for i in range(50):
+            with self.assertRaises(JwksError):
+                self.cache.get_key('forged-%d' % i)
+        self.assertEqual(self.source.fetches, 1)
+        self.clock.now = 30
+        self.source.failing = False
+        self.assertEqual(self.cache.get_key('key-1')['kid'], 'key-1')
+        self.assertEqual(self.source.fetches, 2)
+
+    def test_expired_keys_and_unknown_kid_fetch_once(self):
+        self.cache.get_key('key-1')
+        self.clock.now = 600
+        self.assertIsNone(self.cache.get_key('forged'))
+        self.assertEqual(self.source.fetches, 2)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        source = Counting_source(jwks_document, delay=0.05)
+        cache = JwksCache(source)
+        keys = []
+        threads = [threading.Thread(target=lambda: keys.append(cache.get_key('key-1'))) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(source.fetches, 1)
+        self.assertEqual(len(keys), 20)
+
+    def test_file_source(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as jwks_file:
+            json.dump(jwks_document, jwks_file)
+        try:
+            cache = JwksCache(FileJwksSource(jwks_file.name))
+            self.assertEqual(cache.get_key('key-1')['e'], 'AQAB')
+        finally:
+            os.remove(jwks_file.name)
+
+class Token_cache(unittest.TestCase):
+    """This class represents the offline tests of the verified tokens cache"""
+
+    def setUp(self):
+        auth.token_cache.clear()
+
+    def test_lru_eviction_and_counters(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entries_dropped_at_expiry(self):
+        clock = Clock()
+        cache = LRUCache(clock=clock)
+        cache.set('token', 'payload', expires_at=10)
+        clock.now = 9
+        self.assertEqual(cache.get('token'), 'payload')
+        clock.now = 10
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_reused_token_is_verified_once(self):
+        payload = {'exp': time.time() + 60, 'permissions': []}
+        with mock.patch('auth.decode_jwt', return_value=payload) as decode_jwt:
+            auth.verify_decode_jwt('token')
+            self.assertIs(auth.verify_decode_jwt('token'), payload)
+            auth.verify_decode_jwt('other token')
+        self.assertEqual(decode_jwt.call_count, 2)
+
+    def test_expired_token_is_verified_again(self):
+        payload = {'exp': time.time() - 1, 'permissions': []}
+        with mock.patch('auth.decode_jwt', return_value=payload) as decode_jwt:
+            auth.verify_decode_jwt('token')
+            auth.verify_decode_jwt('token')
+        self.assertEqual(decode_jwt.call_count, 2)
+
+class Permissions(unittest.TestCase):
+    """This class represents the offline tests of the RBAC checks"""
+
+    def setUp(self):
+        self.payload = {'permissions': ['get:actors', 'patch:actors']}
+        self.granted = auth.token_permissions(self.payload)
+
+    def test_single_permission(self):
+        self.assertTrue(auth.check_permissions('get:actors', self.payload))
+        with self.assertRaises(auth.AuthError) as error:
+            auth.check_permissions('delete:movies', self.payload, self.granted)
+        self.assertEqual(error.exception.status_code, 403)
+
+    def test_all_of(self):
+        requirement = auth.all_of('get:actors', 'patch:actors')
+        self.assertTrue(auth.check_permissions(requirement, self.payload, self.granted))
+        with self.assertRaises(auth.AuthError):
+            auth.check_permissions(auth.all_of('get:actors', 'delete:actors'), self.payload, self.granted)
+
+    def test_any_of(self):
+        requirement = auth.any_of('delete:actors', 'patch:actors')
+        self.assertTrue(auth.check_permissions(requirement, self.payload, self.granted))
+        with self.assertRaises(auth.AuthError):
+            auth.check_permissions(auth.any_of('delete:actors', 'delete:movies'), self.payload, self.granted)
+
+    def test_missing_permissions_claim(self):
+        with self.assertRaises(auth.AuthError) as error:
+            auth.check_permissions('get:actors', {})
+        self.assertEqual(error.exception.status_code, 400)
+
+    def test_permissions_cached_with_token(self):
+        auth.token_cache.clear()
+        payload = {'exp': time.time() + 60, 'permissions': ['get:movies']}
+        with mock.patch('auth.decode_jwt', return_value=payload):
+            verified = auth.verify_token('token')
+        self.assertIs(auth.verify_token('token'), verified)
+        self.assertEqual(verified.permissions, frozenset(['get:movies']))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
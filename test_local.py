@@ -0,0 +1,709 @@
+import os
+import unittest
+import json
+from contextlib import contextmanager
+from unittest import mock
+from datetime import datetime, timezone
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import auth
+from app import create_app, response_cache
+from models import db, Movie, Actor, Assigning_actors_movies, Gender
+from models import find_missing_ids, known_ids, ids_filter, delete_entities
+from entities import entity_cache
+from search import fallback_indexes, postgresql_search
+import search as search_module
+from sqlalchemy import event, create_engine, exc
+from sqlalchemy.dialects import postgresql
+import asyncio
+import subprocess
+import sys
+import tempfile
+import pool
+from asgi import WsgiToAsgi
+from validators import actor_schema, movie_schema
+from dates import parse_release_date, format_release_date
+from endpoints_errors import actor_age_error, actor_gender_error, actor_movies_error
+
+all_permissions = [
+    'get:actors', 'get:movies',
+    'post:actors', 'post:movies',
+    'patch:actors', 'patch:movies',
+    'delete:actors', 'delete:movies'
+    ]
+
+@contextmanager
+def authorized(permissions=all_permissions):
+    """Accepts any bearer token as one granting `permissions`"""
+    payload = {'permissions': list(permissions)}
+    verified = auth.VerifiedToken(payload, frozenset(permissions))
+    with mock.patch('auth.verify_token', return_value=verified):
+        yield
+
+@contextmanager
+def count_queries(engine):
+    """Collects the statements executed on `engine`, but the table versions bookkeeping"""
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'table_versions' not in statement:
+            statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+class Local_casting_agency(unittest.TestCase):
+    """This class represents the casting_agency test case running on an
+    in-memory SQLite database, without postgres nor Auth0"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.client = self.app.test_client
+        self.headers = {"Authorization": "Bearer local"}
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.engine = db.get_engine(self.app)
+        self.seeded = 0
+        known_ids.clear()
+        response_cache.clear()
+        entity_cache.clear()
+        fallback_indexes.clear()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def seed(self, nb_actors, nb_movies, movies_per_actor=2):
+        self.seeded += 1
+        movies = [
+            Movie('movie %s.%s' % (self.seeded, i), datetime(2020, 5, 3, 23, tzinfo=timezone.utc))
+            for i in range(nb_movies)
+            ]
+        db.session.add_all(movies)
+        db.session.flush()
+        for i in range(nb_actors):
+            actor_movies = [
+                Assigning_actors_movies(movie_id=movies[(i + j) % nb_movies].id)
+                for j in range(min(movies_per_actor, nb_movies))
+                ]
+            db.session.add(Actor('actor %s.%s' % (self.seeded, i), 30, Gender.male, actor_movies))
+        db.session.commit()
+
+    def get(self, url):
+        with authorized():
+            res = self.client().get(url, headers=self.headers)
+        return res, json.loads(res.data)
+
+    def test_get_actors_query_count_is_constant(self):
+        self.seed(5, 3)
+        with count_queries(self.engine) as few_rows_queries:
+            res, data = self.get('/actors')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_actors'], 5)
+        self.assertEqual(len(data['actors'][0]['movies']), 2)
+        self.seed(200, 50)
+        with count_queries(self.engine) as many_rows_queries:
+            res, data = self.get('/actors')
+        self.assertEqual(data['total_actors'], 205)
+        self.assertEqual(len(many_rows_queries), len(few_rows_queries))
+
+    def test_get_movies_query_count_is_constant(self):
+        self.seed(5, 3)
+        with count_queries(self.engine) as few_rows_queries:
+            res, data = self.get('/movies')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(sum(len(movie['actors']) for movie in data['movies']), 10)
+        self.seed(200, 50)
+        with count_queries(self.engine) as many_rows_queries:
+            res, data = self.get('/movies')
+        self.assertEqual(data['total_movies'], 53)
+        self.assertEqual(len(many_rows_queries), len(few_rows_queries))
+
+    def test_get_actors_keyset_pages(self):
+        self.seed(25, 3)
+        ids, url = [], '/actors?limit=10'
+        while url:
+            res, data = self.get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertLessEqual(len(data['actors']), 10)
+            ids += [actor['id'] for actor in data['actors']]
+            url = data['next_cursor'] and '/actors?limit=10&after=' + data['next_cursor']
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_422_invalid_page_parameters(self):
+        self.seed(2, 1)
+        res, data = self.get('/movies?limit=0')
+        self.assertEqual(res.status_code, 422)
+        res, data = self.get('/movies?limit=5&after=not-a-cursor')
+        self.assertEqual(res.status_code, 422)
+
+    def test_stream_movies_ndjson(self):
+        self.seed(4, 12)
+        with authorized(), mock.patch('pagination.stream_batch_size', 5):
+            res = self.client().get('/movies?stream=ndjson', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        movies = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual(len(movies), 12)
+        self.assertEqual(sum(len(movie['actors']) for movie in movies), 8)
+
+    def test_stream_actors_json(self):
+        self.seed(7, 2)
+        res, data = self.get('/actors?stream=json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['actors']), 7)
+
+    def test_listings_match_entities_format(self):
+        def unordered(items, key):
+            return [dict(item, **{key: sorted(item[key])}) for item in items]
+        self.seed(6, 4)
+        res, data = self.get('/movies')
+        self.assertEqual(
+            unordered(data['movies'], 'actors'),
+            unordered([movie.format() for movie in Movie.query.order_by(Movie.id)], 'actors'))
+        self.assertEqual(data['movies'][0]['release_date'], '03/05/2020 23:00 UTC+00')
+        res, data = self.get('/actors?limit=4')
+        self.assertEqual(
+            unordered(data['actors'], 'movies'),
+            unordered([actor.format() for actor in Actor.query.order_by(Actor.id).limit(4)], 'movies'))
+
+    def post(self, url, body):
+        with authorized():
+            res = self.client().post(url, headers=self.headers, json=body)
+        return res, json.loads(res.data)
+
+    def test_bulk_create_actors_and_movies(self):
+        res, data = self.post('/movies/bulk', [
+            {'title': 'bulk %s' % i, 'release_date': '03/05/2020 23:00 UTC+01'}
+            for i in range(600)
+            ])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_created'], 600)
+        movies_ids = data['created']
+        with count_queries(self.engine) as statements:
+            res, data = self.post('/actors/bulk', {'actors': [
+                {'name': 'bulk %s' % i, 'age': 30, 'gender': 'female', 'movies': movies_ids[i:i + 3]}
+                for i in range(600)
+                ]})
+        self.assertEqual(res.status_code, 200)
+        # one multi-row INSERT per 500 rows, no executemany (one INSERT per row on psycopg2)
+        inserts = [statement.split()[2] for statement in statements if statement.startswith('INSERT')]
+        self.assertEqual(inserts, ['actors'] * 2 + ['actors_movies'] * 4)
+        self.assertEqual(Actor.query.count(), 600)
+        self.assertEqual(Assigning_actors_movies.query.count(), 1797)
+        actor = Actor.query.get(data['created'][10])
+        self.assertEqual(actor.name, 'bulk 10')
+        self.assertEqual(sorted(link.movie_id for link in actor.movies), movies_ids[10:13])
+
+    def test_422_bulk_create_reports_errors_per_item(self):
+        self.seed(1, 1)
+        res, data = self.post('/actors/bulk', [
+            {'name': 'valid', 'age': 30, 'gender': 'male'},
+            {'name': 'actor 1.0', 'age': 30, 'gender': 'male'},
+            {'name': 'young', 'age': 3, 'gender': 'male'},
+            {'age': 30, 'gender': 'male'},
+            {'name': 'unknown movie', 'age': 30, 'gender': 'male', 'movies': [404]},
+            ])
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual([error['index'] for error in data['message']['errors']], [1, 2, 3, 4])
+        self.assertEqual(data['message']['errors'][2]['description'], '`name` is required')
+        self.assertEqual(Actor.query.count(), 1)
+
+    def test_422_missing_references_reported_before_any_write(self):
+        self.seed(1, 2)
+        with count_queries(self.engine) as statements:
+            res, data = self.post('/actors', {
+                'name': 'new actor', 'age': 30, 'gender': 'male', 'movies': [1, 404, 405]
+                })
+        self.assertEqual(res.status_code, 422)
+        self.assertIn('[404, 405]', data['message']['description'])
+        self.assertFalse([statement for statement in statements if statement.startswith('INSERT')])
+
+    def test_ids_filters_bind_their_own_values_on_postgres(self):
+        table = Assigning_actors_movies.__table__
+        with mock.patch('models.is_postgresql', return_value=True):
+            statement = table.select().where(ids_filter(table.c.actor_id, [1])).where(ids_filter(table.c.movie_id, [2]))
+        params = statement.compile(dialect=postgresql.dialect()).params
+        self.assertEqual(sorted(params.values()), [[1], [2]])
+
+    def test_find_missing_ids_caches_existing_ids(self):
+        self.seed(3, 1)
+        self.assertEqual(find_missing_ids(Actor, [1, 2, 7]), {7})
+        with count_queries(self.engine) as statements:
+            self.assertEqual(find_missing_ids(Actor, [1, 2]), set())
+        self.assertEqual(statements, [])
+
+    def test_deleted_ids_are_evicted_once_committed(self):
+        self.seed(3, 1)
+        find_missing_ids(Actor, [1, 2])
+        delete_entities(Actor, [1])
+        # not committed yet: the row may still come back
+        self.assertIsNotNone(known_ids.get(('actors', 1)))
+        db.session.rollback()
+        self.assertEqual(find_missing_ids(Actor, [1]), set())
+        delete_entities(Actor, [1])
+        Actor.query.get(2).delete()
+        db.session.commit()
+        self.assertEqual(find_missing_ids(Actor, [1, 2]), {1, 2})
+
+    def patch(self, url, body):
+        with authorized():
+            res = self.client().patch(url, headers=self.headers, json=body)
+        return res, json.loads(res.data)
+
+    def test_update_actor_reordered_movies_is_unchanged(self):
+        self.seed(1, 3, movies_per_actor=3)
+        movies = [link.movie_id for link in Actor.query.get(1).movies]
+        with count_queries(self.engine) as statements:
+            res, data = self.patch('/actors/1', {'movies': movies[::-1]})
+        self.assertEqual(data['updated'], 'unchanged')
+        self.assertFalse([statement for statement in statements if not statement.startswith('SELECT')])
+
+    def test_update_movie_writes_only_the_diff(self):
+        self.seed(4, 1, movies_per_actor=1)
+        with count_queries(self.engine) as statements:
+            res, data = self.patch('/movies/1', {'actors': [4, 2, 1, 2]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(sorted(data['updated']['actors']), [1, 2, 4])
+        writes = [statement.split()[0] for statement in statements if not statement.startswith('SELECT')]
+        self.assertEqual(writes, ['DELETE'])
+        res, data = self.patch('/movies/1', {'actors': [1, 2, 3, 4]})
+        self.assertEqual(sorted(data['updated']['actors']), [1, 2, 3, 4])
+
+    def test_listing_served_from_cache_until_a_write(self):
+        self.seed(3, 2)
+        res, data = self.get('/movies')
+        with count_queries(self.engine) as statements:
+            res, cached = self.get('/movies')
+        self.assertEqual(statements, [])
+        self.assertEqual(cached, data)
+        res, data = self.get('/actors?limit=2')
+        self.patch('/actors/1', {'movies': [1]})
+        res, data = self.get('/movies')
+        self.assertNotEqual(data, cached)
+        self.assertEqual(data['movies'][1]['actors'], [2, 3])
+        res, data = self.get('/actors?limit=2')
+        self.assertEqual(data['actors'][0]['movies'], [1])
+
+    def test_listing_cache_ignores_rolled_back_writes(self):
+        self.seed(2, 1)
+        res, data = self.get('/actors')
+        Actor.query.get(1).name = 'renamed'
+        db.session.flush()
+        db.session.rollback()
+        with count_queries(self.engine) as statements:
+            self.get('/actors')
+        self.assertEqual(statements, [])
+
+    def test_304_when_etag_matches_without_reading_rows(self):
+        self.seed(3, 2)
+        res, data = self.get('/actors')
+        etag = res.headers['ETag']
+        with authorized(), count_queries(self.engine) as statements:
+            res = self.client().get('/actors', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(statements, [])
+        res, data = self.get('/actors?limit=2')
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.patch('/movies/1', {'actors': [1]})
+        with authorized():
+            res = self.client().get('/actors', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_actor_with_movies_from_identity_cache(self):
+        self.seed(2, 3)
+        res, data = self.get('/actors/1?include=movies')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actor']['movies'], [1, 2])
+        self.assertEqual([movie['title'] for movie in data['movies']], ['movie 1.0', 'movie 1.1'])
+        with count_queries(self.engine) as statements:
+            res, cached = self.get('/actors/1?include=movies')
+        self.assertEqual(statements, [])
+        self.assertEqual(cached, data)
+        self.patch('/movies/2', {'title': 'renamed'})
+        res, data = self.get('/actors/1?include=movies')
+        self.assertEqual(data['movies'][1]['title'], 'renamed')
+        res, data = self.get('/movies/404')
+        self.assertEqual(res.status_code, 404)
+
+    def test_422_or_403_include(self):
+        self.seed(1, 1)
+        res, data = self.get('/movies/1?include=directors')
+        self.assertEqual(res.status_code, 422)
+        with authorized(['get:movies']):
+            res = self.client().get('/movies/1?include=actors', headers=self.headers)
+        self.assertEqual(res.status_code, 403)
+        # the include permission is checked against the token cached permissions
+        with mock.patch('auth.token_permissions', side_effect=AssertionError):
+            res, data = self.get('/movies/1?include=actors')
+        self.assertEqual(res.status_code, 200)
+
+    def test_delete_movie_without_loading_it(self):
+        self.seed(2, 2)
+        res, data = self.get('/actors/1')
+        self.assertEqual(data['actor']['movies'], [1, 2])
+        with authorized():
+            res = self.client().delete('/movies/1', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        res, data = self.get('/actors/1')
+        self.assertEqual(data['actor']['movies'], [2])
+        self.assertEqual(Assigning_actors_movies.query.filter_by(movie_id=1).count(), 0)
+        with authorized():
+            res = self.client().delete('/movies/1', headers=self.headers)
+        self.assertEqual(res.status_code, 404)
+
+    def test_delete_cascades_in_the_database(self):
+        self.seed(4, 2, movies_per_actor=2)
+        res, data = self.get('/actors/2')
+        self.assertEqual(sorted(data['actor']['movies']), [1, 2])
+        with count_queries(self.engine) as queries:
+            with authorized():
+                res = self.client().delete('/movies/1', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        deletes = [statement for statement in queries if statement.startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(Assigning_actors_movies.query.filter_by(movie_id=1).count(), 0)
+        res, data = self.get('/actors/2')
+        self.assertEqual(data['actor']['movies'], [2])
+        # the ORM delete doesn't load the assignments either, and the
+        # cached payloads of the linked movies are invalidated as well
+        res, data = self.get('/movies/2')
+        self.assertIn(1, data['movie']['actors'])
+        res, data = self.get('/movies')
+        etag = res.headers['ETag']
+        actor = Actor.query.get(1)
+        with count_queries(self.engine) as queries:
+            actor.delete()
+        self.assertFalse([statement for statement in queries if statement.startswith('DELETE FROM actors_movies')])
+        db.session.commit()
+        self.assertEqual(Assigning_actors_movies.query.filter_by(actor_id=1).count(), 0)
+        res, data = self.get('/movies/2')
+        self.assertNotIn(1, data['movie']['actors'])
+        res, data = self.get('/movies')
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def delete(self, url, body=None):
+        with authorized():
+            res = self.client().delete(url, headers=self.headers, json=body)
+        return res, json.loads(res.data)
+
+    def test_bulk_delete_ids_and_filters(self):
+        self.seed(6, 3)
+        res, data = self.get('/actors/1')
+        with count_queries(self.engine) as queries:
+            res, data = self.delete('/actors', {'ids': [1, 2, 42, 2]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['deleted'], data['missing'], data['total_deleted']), ([1, 2], [42], 2))
+        self.assertEqual(len([statement for statement in queries if statement.startswith('DELETE')]), 1)
+        res, data = self.get('/actors/1')
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(Assigning_actors_movies.query.filter(Assigning_actors_movies.actor_id <= 2).count(), 0)
+        # ids and filters are combined, filters alone delete all the matching rows
+        res, data = self.delete('/actors?name_prefix=nobody', [3, 4])
+        self.assertEqual((data['deleted'], data['missing']), ([], [3, 4]))
+        res, data = self.delete('/actors?name_prefix=actor%201.')
+        self.assertEqual((data['deleted'], data['missing']), ([3, 4, 5, 6], []))
+        res, data = self.get('/movies')
+        self.assertEqual([movie['actors'] for movie in data['movies']], [[], [], []])
+
+    def test_422_bulk_delete_without_ids_nor_filters(self):
+        self.seed(2, 1)
+        for body in (None, [], {'ids': ['1']}, {'id': [1]}, [True]):
+            res, data = self.delete('/movies', body)
+            self.assertEqual(res.status_code, 422)
+        res, data = self.delete('/movies?released_after=tomorrow')
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Movie.query.count(), 1)
+
+    def test_422_reports_all_the_rejected_fields(self):
+        res, data = self.post('/actors', {'name': 'new actor', 'age': 3, 'gender': 'other', 'movies': [True]})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(
+            [error['description'] for error in data['message']['errors']],
+            [actor_age_error.error['description'], actor_gender_error.error['description'], actor_movies_error.error['description']])
+        res, data = self.post('/movies', {'release_date': '3/5/2020'})
+        self.assertEqual(len(data['message']['errors']), 2)
+        # a single problem is reported as is
+        res, data = self.post('/movies', {'release_date': '03/05/2020 23:00 UTC+01'})
+        self.assertEqual(data['message'], {'error': 'missing movie informations', 'description': '`title` is required'})
+        res, data = self.post('/movies/bulk', [{'title': 1, 'release_date': 'today'}, 'movie'])
+        self.assertEqual([len(error['errors']) for error in data['message']['errors'][:1]], [2])
+        self.assertEqual(data['message']['errors'][1]['index'], 1)
+
+    def test_validated_ids_are_deduplicated_sets(self):
+        self.seed(1, 2)
+        actor = actor_schema.validate({'name': 'a', 'age': 20, 'gender': 'Female', 'movies': [2, 1, 2]})
+        self.assertEqual(actor, {'name': 'a', 'age': 20, 'gender': Gender.female, 'movies': {1, 2}})
+        self.assertEqual(movie_schema.validate({'actors': [1, 1]}, partial=True), {'actors': {1}})
+        res, data = self.post('/actors', {'name': 'new actor', 'age': 40, 'gender': 'Female', 'movies': [1, 1, 2]})
+        self.assertEqual(res.status_code, 200)
+        res, data = self.get('/actors/%s' % data['created'])
+        self.assertEqual((data['actor']['gender'], sorted(data['actor']['movies'])), ('female', [1, 2]))
+        with authorized():
+            res = self.client().patch('/actors/1', headers=self.headers, json={'gender': 'FEMALE'})
+        self.assertEqual(json.loads(res.data)['updated']['gender'], 'female')
+
+    def test_release_dates_legacy_and_iso_8601(self):
+        legacy = '3/5/2020 23:5 UTC+01'
+        parsed = parse_release_date(legacy)
+        self.assertEqual(parsed, datetime.strptime(legacy + '00', '%d/%m/%Y %H:%M UTC%z'))
+        self.assertEqual(format_release_date(parsed), parsed.strftime('%d/%m/%Y %H:%M UTC%z')[0:-2])
+        self.assertEqual(parse_release_date('2020-05-03T23:05+01:00'), parsed)
+        self.assertEqual(parse_release_date('2020-05-03T22:05:00Z'), parsed)
+        # offsets share their timezone object
+        self.assertIs(parse_release_date('2021-01-01T00:00+0100').tzinfo, parsed.tzinfo)
+        for value in ('30/02/2020 10:00 UTC+01', '3/5/2020 23:05 UTC+1', '2020-05-03T23:05+25:00', '2020-5-3', 20200503):
+            self.assertIsNone(parse_release_date(value))
+        res, data = self.post('/movies', {'title': 'iso movie', 'release_date': '2020-05-03T23:05+01:00'})
+        self.assertEqual(res.status_code, 200)
+        # stored in UTC, SQLite has no timezone support
+        res, data = self.get('/movies/%s' % data['created'])
+        self.assertEqual(data['movie']['release_date'], '03/05/2020 22:05 UTC+00')
+
+    def test_integrity_error_leaves_a_usable_session(self):
+        self.seed(1, 1)
+        res, data = self.post('/actors', {'name': 'actor 1.0', 'age': 40, 'gender': 'female'})
+        self.assertEqual(res.status_code, 422)
+        res, data = self.post('/actors', {'name': 'new actor', 'age': 40, 'gender': 'female', 'movies': [1]})
+        self.assertEqual(res.status_code, 200)
+        db.session.remove()
+        self.assertEqual(Actor.query.get(data['created']).name, 'new actor')
+
+    def test_failed_request_rolls_back_its_flushed_writes(self):
+        self.seed(1, 1)
+        commits = []
+        event.listen(self.engine, 'commit', lambda conn: commits.append(conn))
+        with mock.patch.object(Actor, 'format', side_effect=RuntimeError):
+            with authorized():
+                res = self.client().patch('/actors/1', headers=self.headers, json={'name': 'renamed', 'movies': []})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(commits, [])
+        db.session.remove()
+        self.assertEqual(Actor.query.get(1).name, 'actor 1.0')
+        self.assertEqual(Assigning_actors_movies.query.count(), 1)
+        # a successful request commits its writes once
+        with authorized():
+            res = self.client().patch('/actors/1', headers=self.headers, json={'name': 'renamed', 'movies': []})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(commits), 1)
+
+    def test_422_when_the_commit_conflicts(self):
+        conflict = exc.IntegrityError('COMMIT', {}, Exception('unique constraint'))
+        with mock.patch.object(db.session, 'commit', side_effect=conflict):
+            res, data = self.post('/movies', {'title': 'new movie', 'release_date': '03/05/2020 23:00 UTC+01'})
+        self.assertEqual(res.status_code, 422)
+        self.assertIn('written meanwhile', data['message']['description'])
+        self.assertEqual(Movie.query.count(), 0)
+
+    def test_filtered_actors_sorted_pages(self):
+        ages = [20, 35, 35, 50, 35, 28, 41, 35]
+        for i, age in enumerate(ages):
+            db.session.add(Actor('actor %s' % i, age, Gender.female if i % 2 else Gender.male, []))
+        db.session.commit()
+        ids, url = [], '/actors?min_age=25&max_age=45&sort=-age&limit=2'
+        while url:
+            res, data = self.get(url)
+            self.assertEqual(res.status_code, 200)
+            ids += [actor['id'] for actor in data['actors']]
+            url = data['next_cursor'] and '/actors?min_age=25&max_age=45&sort=-age&limit=2&after=' + data['next_cursor']
+        self.assertEqual(ids, [7, 8, 5, 3, 2, 6])
+        res, data = self.get('/actors?gender=female&name_prefix=actor%201')
+        self.assertEqual([actor['name'] for actor in data['actors']], ['actor 1'])
+        res, data = self.get('/actors?sort=height')
+        self.assertEqual(res.status_code, 422)
+
+    def test_movies_release_window_and_title_prefix(self):
+        for i in range(5):
+            db.session.add(Movie('100%% movie %s' % i, datetime(2020, 1 + i, 1, tzinfo=timezone.utc), []))
+        db.session.add(Movie('1000 movie', datetime(2020, 3, 1, tzinfo=timezone.utc), []))
+        db.session.commit()
+        res, data = self.get('/movies?released_after=2020-02-01&released_before=2020-04-01&title_prefix=100%25')
+        self.assertEqual([movie['title'] for movie in data['movies']], ['100% movie 1', '100% movie 2'])
+        # the same ISO 8601 forms as the payloads release dates
+        res, data = self.get('/movies?released_after=2020-02-01T00:00Z&released_before=2020-04-01%2000:00:00%2B00:00')
+        self.assertEqual([movie['title'] for movie in data['movies']], ['100% movie 1', '100% movie 2', '1000 movie'])
+        res, data = self.get('/movies?released_after=yesterday')
+        self.assertEqual(res.status_code, 422)
+
+    def test_fields_projection_skips_associations(self):
+        self.seed(3, 2)
+        with count_queries(self.engine) as statements:
+            res, data = self.get('/actors?fields=name')
+        self.assertEqual(data['actors'][0], {'id': 1, 'name': 'actor 1.0'})
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('actors_movies', statements[0])
+        res, data = self.get('/movies?fields=title,actors&sort=-title&limit=1')
+        self.assertEqual(data['movies'], [{'id': 2, 'title': 'movie 1.1', 'actors': [1, 2, 3]}])
+
+    def test_search_ranks_actors_and_movies(self):
+        for name in ['Marion Cotillard', 'Mario Adorf', 'Jean Reno']:
+            db.session.add(Actor(name, 40, Gender.male, []))
+        db.session.add(Movie('Super Mario Bros', datetime(1993, 5, 28, tzinfo=timezone.utc), []))
+        db.session.commit()
+        res, data = self.get('/search?q=mario')
+        self.assertEqual(res.status_code, 200)
+        results = [(result['type'], result['id']) for result in data['results']]
+        self.assertEqual(results, [('actor', 2), ('movie', 1), ('actor', 1)])
+        self.assertEqual(data['results'][0]['name'], 'Mario Adorf')
+        res, data = self.get('/search?q=mario&type=movies&limit=1')
+        self.assertEqual(data['results'][0]['title'], 'Super Mario Bros')
+        self.assertEqual(data['next_offset'], 1)
+        self.patch('/actors/3', {'name': 'Mariotto'})
+        res, data = self.get('/search?q=mario&type=actors&offset=2')
+        self.assertEqual([result['name'] for result in data['results']], ['Marion Cotillard'])
+
+    def test_postgresql_search_applies_the_similarity_threshold(self):
+        with mock.patch.object(db.session, 'execute', return_value=[]) as execute:
+            postgresql_search('tom', ['actors'], 10)
+        statement, params = execute.call_args_list[0][0]
+        self.assertIn('pg_trgm.similarity_threshold', str(statement))
+        self.assertEqual(params, {'threshold': str(search_module.similarity_threshold)})
+
+    def test_search_only_readable_tables(self):
+        self.seed(1, 1)
+        with authorized(['get:movies']):
+            res = self.client().get('/search?q=1.0', headers=self.headers)
+        data = json.loads(res.data)
+        self.assertEqual([result['type'] for result in data['results']], ['movie'])
+        with authorized(['get:movies']):
+            res = self.client().get('/search?q=1.0&type=actors', headers=self.headers)
+        self.assertEqual(res.status_code, 422)
+        res, data = self.get('/search?q=movie&limit=500')
+        self.assertEqual(res.status_code, 422)
+
+    def test_metrics_endpoint(self):
+        # closed unless a token is set or open access is asked for
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 404)
+        with mock.patch('app.metrics_public', True):
+            res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('# TYPE db_pool_checkout_wait_seconds histogram', res.data.decode())
+        with mock.patch('app.metrics_token', 'secret'):
+            res = self.client().get('/metrics')
+            self.assertEqual(res.status_code, 401)
+            res = self.client().get('/metrics', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(res.status_code, 200)
+
+    def test_server_timing_and_route_latency_metrics(self):
+        self.seed(3, 2)
+        with count_queries(self.engine) as queries:
+            res, data = self.get('/actors')
+        timing = dict(
+            (part.split(';')[0], part.split(';')[1:])
+            for part in res.headers['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timing), {'auth', 'db', 'serialization', 'total'})
+        # the table versions reads count as well
+        reported = int(timing['db'][1][len('desc="'):-len(' queries"')])
+        self.assertGreaterEqual(reported, len(queries))
+        with mock.patch('app.metrics_public', True):
+            metrics = self.client().get('/metrics').data.decode()
+            self.assertIn('http_request_duration_seconds_count{method="GET",route="/actors"}', metrics)
+            self.assertIn('http_request_db_queries_bucket{method="GET",route="/actors",le="+Inf"}', metrics)
+            self.assertIn('http_request_serialization_seconds_sum{method="GET",route="/actors"}', metrics)
+            self.client().get('/missing')
+            self.assertIn('route="unmatched"', self.client().get('/metrics').data.decode())
+
+    def asgi_get(self, path, query_string=b'', root_path='', wsgi_app=None):
+        """Runs a GET through the ASGI adapter, returns the response messages"""
+        messages = []
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        async def send(message):
+            messages.append(message)
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string,
+            'root_path': root_path, 'headers': [(b'authorization', b'Bearer local')]
+        }
+        with authorized():
+            asyncio.run(WsgiToAsgi(wsgi_app or self.app, threads=2)(scope, receive, send))
+        return messages
+
+    def test_asgi_adapter_serves_the_same_routes(self):
+        self.seed(3, 2)
+        messages = self.asgi_get('/actors', b'fields=name')
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn((b'content-type', b'application/json'), messages[0]['headers'])
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        self.assertEqual(json.loads(body)['total_actors'], 3)
+        messages = self.asgi_get('/movies', b'stream=ndjson')
+        self.assertEqual(len(b''.join(message.get('body', b'') for message in messages).splitlines()), 2)
+        messages = self.asgi_get('/actors/404')
+        self.assertEqual(messages[0]['status'], 404)
+
+    def test_asgi_adapter_root_path_and_write(self):
+        self.seed(1, 1)
+        # mounted under /api: the prefix is the SCRIPT_NAME, not part of the route
+        messages = self.asgi_get('/api/actors/1', root_path='/api')
+        self.assertEqual(messages[0]['status'], 200)
+        def legacy_app(environ, start_response):
+            write = start_response('200 OK', [('Content-Type', 'text/plain')])
+            write(environ['SCRIPT_NAME'].encode() + b' ')
+            return [environ['PATH_INFO'].encode()]
+        messages = self.asgi_get('/api/health', root_path='/api', wsgi_app=legacy_app)
+        self.assertEqual(b''.join(message.get('body', b'') for message in messages), b'/api /health')
+
+
+class Pool_metrics(unittest.TestCase):
+    """Instrumented connection pool, on a SQLite file"""
+
+    def test_checkout_wait_timeouts_and_saturation(self):
+        with tempfile.NamedTemporaryFile(suffix='.db') as database:
+            engine = create_engine(
+                'sqlite:///' + database.name, poolclass=pool.InstrumentedQueuePool,
+                pool_size=1, max_overflow=0, pool_timeout=0.05)
+            waits = pool.checkout_wait.counts[:]
+            timeouts = pool.checkout_timeouts.value
+            opened = pool.connections_opened.value
+            connection = engine.connect()
+            self.assertEqual(pool.registry.metrics['db_pool_saturation'].function(), 1)
+            with self.assertRaises(exc.TimeoutError):
+                engine.connect()
+            connection.close()
+            engine.dispose()
+        self.assertEqual(sum(pool.checkout_wait.counts) - sum(waits), 2)
+        self.assertEqual(pool.checkout_timeouts.value - timeouts, 1)
+        self.assertEqual(pool.connections_opened.value - opened, 1)
+
+    def test_pool_size_shares_the_connections_budget(self):
+        with mock.patch.multiple(pool, web_concurrency=4, db_max_connections=20,
+                db_pool_size=8, db_max_overflow=2):
+            self.assertEqual(pool.worker_pool_size(), (5, 0))
+            options = pool.engine_options('postgresql://localhost/casting')
+        self.assertEqual(options['pool_size'], 5)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertIn('statement_timeout', options['connect_args']['options'])
+        self.assertNotIn('poolclass', pool.engine_options('sqlite://'))
+
+
+class Startup(unittest.TestCase):
+    """Importing the application needs no database"""
+
+    def test_import_without_database_url(self):
+        environment = {name: value for name, value in os.environ.items() if name != 'DATABASE_URL'}
+        # migrations tooling and jose are not loaded by a serving process
+        probe = (
+            'import sys, app, models\n'
+            'loaded = {"flask_migrate", "alembic", "jose"} & set(sys.modules)\n'
+            'assert not loaded, loaded'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', probe],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=environment,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(result.returncode, 0, result.stderr.decode())
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
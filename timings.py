@@ -0,0 +1,100 @@
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import registry
+
+'''
+request timings
+    each request accumulates the time it spends in its phases (auth, db,
+    serialization) and its number of queries in flask.g, they are
+    observed per route once the response is built and sent back in the
+    Server-Timing header
+    the db time spent inside another phase (associations read while
+    formatting) is only counted as db time
+'''
+request_phases = ('auth', 'db', 'serialization')
+
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time to build the responses, per route',
+    label_names=('method', 'route'))
+phase_durations = {
+    phase: registry.histogram(
+        'http_request_%s_seconds' % phase, 'Time spent in %s while building the responses, per route' % phase,
+        label_names=('method', 'route'))
+    for phase in request_phases
+}
+request_queries = registry.histogram(
+    'http_request_db_queries', 'Database statements run to build the responses, per route',
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100), label_names=('method', 'route'))
+
+def start_request_timing():
+    g.timings = dict.fromkeys(request_phases, 0.0)
+    g.queries = 0
+    g.request_start = time.perf_counter()
+
+def current_timings():
+    if has_request_context():
+        return g.get('timings')
+    return None
+
+'''
+timed(phase)
+    adds the time spent in the block to the current request `phase`
+'''
+@contextmanager
+def timed(phase):
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    db_before = timings['db']
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if phase != 'db':
+            elapsed -= timings['db'] - db_before
+        timings[phase] += elapsed
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timing(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def finish_query_timing(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    timings = current_timings()
+    if timings is not None:
+        timings['db'] += elapsed
+        g.queries += 1
+
+@event.listens_for(Engine, 'handle_error')
+def discard_query_timing(context):
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+'''
+finish_request_timing(response)
+    observes the request timings under its route and adds them to the
+    response Server-Timing header, in milliseconds
+'''
+def finish_request_timing(response):
+    timings = current_timings()
+    if timings is None:
+        return response
+    total = time.perf_counter() - g.request_start
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_duration.labels(request.method, route).observe(total)
+    for phase in request_phases:
+        phase_durations[phase].labels(request.method, route).observe(timings[phase])
+    request_queries.labels(request.method, route).observe(g.queries)
+    response.headers['Server-Timing'] = ', '.join([
+        'auth;dur=%.2f' % (timings['auth'] * 1000),
+        'db;dur=%.2f;desc="%s queries"' % (timings['db'] * 1000, g.queries),
+        'serialization;dur=%.2f' % (timings['serialization'] * 1000),
+        'total;dur=%.2f' % (total * 1000),
+    ])
+    return response
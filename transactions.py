@@ -0,0 +1,46 @@
+from flask import current_app, request
+from sqlalchemy.exc import IntegrityError
+from models import db, ActionError
+from endpoints_errors import commit_conflict_error
+
+'''
+unit of work
+    a request writes in a single transaction: the models methods and the
+    endpoints only flush their statements, the transaction is committed
+    once the response is built and rolled back if the request failed
+    (error response or exception), the session is never handed over to
+    the next request in a failed transaction
+    reads (GET, HEAD, OPTIONS) have nothing to commit, their transaction
+    ends when the session is removed with the app context
+'''
+read_methods = ('GET', 'HEAD', 'OPTIONS')
+
+'''
+end_request_transaction(response)
+    commits the request writes when `response` is a success, rolls them
+    back otherwise, a conflict detected by the commit is answered as an
+    integrity error instead of `response`
+'''
+def end_request_transaction(response):
+    if request.method in read_methods:
+        return response
+    if response.status_code >= 400:
+        db.session.rollback()
+        return response
+    try:
+        commit_request()
+    except ActionError as error:
+        return current_app.make_response(current_app.handle_user_exception(error))
+    return response
+
+def commit_request():
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise commit_conflict_error
+
+def rollback_request_transaction(exception):
+    # an exception no handler turned into a response
+    if exception is not None:
+        db.session.rollback()
@@ -0,0 +1,162 @@
+from dates import parse_release_date
+from models import ActionError, Gender, actor_name_length, movie_title_length
+from endpoints_errors import actor_name_error, actor_age_error, actor_gender_error
+from endpoints_errors import actor_movies_error, movie_title_error, movie_actors_error
+from endpoints_errors import movie_release_date_error, invalid_fields_error
+
+# returned by a field check for a value it rejects
+invalid = object()
+
+'''
+fields
+    declarations of the checks of a JSON payload value, compile() returns
+    the function checking and converting a sent value, which returns the
+    converted value or `invalid`
+    `error` is the ActionError reporting a rejected value
+'''
+class String:
+    def __init__(self, max_length, error):
+        self.max_length = max_length
+        self.error = error
+
+    def compile(self):
+        max_length = self.max_length
+        def check(value):
+            if type(value) is not str or len(value) > max_length:
+                return invalid
+            return value
+        return check
+
+class Integer:
+    def __init__(self, minimum, maximum, error):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.error = error
+
+    def compile(self):
+        minimum, maximum = self.minimum, self.maximum
+        def check(value):
+            # bool is an int subclass, an exact type check rejects it
+            if type(value) is not int or not minimum <= value <= maximum:
+                return invalid
+            return value
+        return check
+
+class Choice:
+    def __init__(self, choices, error):
+        self.choices = choices
+        self.error = error
+
+    def compile(self):
+        choices = {name.lower(): value for name, value in self.choices.items()}
+        def check(value):
+            if type(value) is not str:
+                return invalid
+            return choices.get(value.lower(), invalid)
+        return check
+
+class IdSet:
+    def __init__(self, error):
+        self.error = error
+
+    def compile(self):
+        def check(value):
+            if type(value) is not list:
+                return invalid
+            for id in value:
+                if type(id) is not int:
+                    return invalid
+            # duplicated ids would violate the actors_movies unique index
+            return set(value)
+        return check
+
+class ReleaseDate:
+    def __init__(self, error):
+        self.error = error
+
+    def compile(self):
+        def check(value):
+            # legacy "%d/%m/%Y %H:%M UTC±HH" or ISO 8601 (see dates.py)
+            release_date = parse_release_date(value)
+            if release_date is None:
+                return invalid
+            return release_date
+        return check
+
+'''
+Schema(resource, fields, required)
+    validator of a `resource` JSON object, compiled once from its `fields`
+    {name: field} and the names of its `required` fields
+    validate(payload, partial=False) checks all the sent fields in one pass
+    and returns their converted values {name: value}, the fields not sent
+    are left out, required ones are only checked when not `partial`
+    it raises an ActionError reporting the rejected and missing fields
+    (the error of the field itself when it is the only one)
+'''
+class Schema:
+    def __init__(self, resource, fields, required=()):
+        self.resource = resource
+        self.fields = fields
+        self.required = tuple(required)
+        self.validate = self.compile()
+
+    def compile(self):
+        resource = self.resource
+        checks = tuple(
+            (name, field.compile(), field.error)
+            for name, field in self.fields.items()
+        )
+        required = tuple(
+            (name, ActionError({
+                'error': 'missing %s informations' % resource,
+                'description': '`%s` is required' % name
+            }, 422))
+            for name in self.required
+        )
+        object_error = ActionError({
+            'error': 'invalide %s informations' % resource,
+            'description': 'the %s must be a JSON object' % resource
+        }, 422)
+
+        def validate(payload, partial=False):
+            if type(payload) is not dict:
+                raise object_error
+            values = {}
+            errors = None
+            for name, check, error in checks:
+                value = payload.get(name)
+                if value is None:
+                    continue
+                value = check(value)
+                if value is invalid:
+                    if errors is None:
+                        errors = []
+                    errors.append(error)
+                else:
+                    values[name] = value
+            if not partial:
+                for name, error in required:
+                    if payload.get(name) is None:
+                        if errors is None:
+                            errors = []
+                        errors.append(error)
+            if errors is not None:
+                # a single problem is reported with its prebuilt error
+                if len(errors) == 1:
+                    raise errors[0]
+                raise invalid_fields_error(resource, [error.error for error in errors])
+            return values
+        return validate
+
+actor_schema = Schema('actor', {
+    'name': String(actor_name_length, actor_name_error),
+    'age': Integer(18, 100, actor_age_error),
+    'gender': Choice({gender.name: gender for gender in Gender}, actor_gender_error),
+    'movies': IdSet(actor_movies_error),
+}, required=('name', 'age', 'gender'))
+
+movie_schema = Schema('movie', {
+    'title': String(movie_title_length, movie_title_error),
+    'release_date': ReleaseDate(movie_release_date_error),
+    'actors': IdSet(movie_actors_error),
+}, required=('title', 'release_date'))